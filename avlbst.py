@@ -8,15 +8,133 @@ Fall 2018
 """
 
 from avlbstnode import *
+from collections.abc import MutableMapping
 import sys
-import queue
+from collections import deque
+import random
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_left
+from mappedavlbst import MappedAVLBST, writeMapped
+from avlbstcursor import AVLBSTCursor
+from avlbstviews import AVLBSTKeysView, AVLBSTValuesView, AVLBSTItemsView
+from avlbstmonoid import Monoid, MONOIDS
 
-class AVLBST(object):
+# owner of the nodes of read-only snapshots: no tree ever owns these
+_READONLY = object()
+# default for pop(): no default given, so raise KeyError
+_MISSING = object()
 
-  def __init__(self):
+class AVLBST(MutableMapping):
+
+  def __init__(self, persistent=False, aggregate=None):
     """avlbst constructor: creates initially empty binary search tree"""
+    # aggregate: Monoid (or "sum", "count", "min", "max") to keep in
+    # every node for aggregate(lo, hi) queries. None: no aggregates
     self.size = 0
     self.root = None
+    # cached left-most/right-most nodes, so findMin/findMax are O(1)
+    self._minNode = None
+    self._maxNode = None
+    # bumped on every change to the tree's shape, so cursors can
+    # tell when their saved paths are no longer any good
+    self._version = 0
+    # persistent trees only change nodes they own (node.owner is
+    # self._owner), and copy any others first. None: own everything
+    if persistent:
+      self._owner = object()
+    else:
+      self._owner = None
+    if isinstance(aggregate, str):
+      aggregate = MONOIDS[aggregate]
+    self._monoid = aggregate
+
+  @classmethod
+  def fromSorted(cls, items, aggregate=None):
+    """build a balanced tree from (key,value) pairs already sorted by key"""
+    # O(n): no per-key descent, no rotations, heights set bottom-up
+    items = list(items)
+    for i in range(1, len(items)):
+      if not items[i-1][0] < items[i][0]:
+        raise ValueError("fromSorted() error: keys not strictly increasing " \
+                         "(%s, %s)" % (str(items[i-1][0]), str(items[i][0])))
+    bst = cls(aggregate=aggregate)
+    bst.root = bst._buildBalanced(items, 0, len(items))
+    bst.size = len(items)
+    bst._resetExtremes()
+    return bst
+
+  @classmethod
+  def fromIterable(cls, items, aggregate=None):
+    """build a balanced tree from (key,value) pairs in any order"""
+    # sort once (stable, so the first of any duplicate keys is kept,
+    # just like repeated insert() calls would do), then bulk-load
+    items = sorted(items, key=lambda item: item[0])
+    unique = []
+    for item in items:
+      if len(unique) == 0 or unique[-1][0] < item[0]:
+        unique.append(item)
+    return cls.fromSorted(unique, aggregate)
+
+  def save(self, filename):
+    """write tree to file in compact binary format (see mappedavlbst.py)"""
+    writeMapped(self._iterItems(), filename)
+
+  @classmethod
+  def openMapped(cls, filename):
+    """open file from save() read-only, without loading it (MappedAVLBST)"""
+    return MappedAVLBST(filename)
+
+  def freeze(self):
+    """return read-only FrozenAVLBST copy, for fast batch lookups (numpy)"""
+    # imported here so numpy is only needed by those who freeze
+    from frozenavlbst import FrozenAVLBST
+    return FrozenAVLBST(self._iterItems())
+
+  def instrument(self, enabled=True):
+    """count comparisons/rotations/etc from now on (see stats()), or stop"""
+    # switches this tree's class, so trees that aren't instrumented
+    # run the plain code below with no counting overhead at all
+    from instrumentedavlbst import InstrumentedAVLBST
+    if enabled and not isinstance(self, InstrumentedAVLBST):
+      self.__class__ = InstrumentedAVLBST
+      self.resetStats()
+    elif not enabled and isinstance(self, InstrumentedAVLBST):
+      self.__class__ = AVLBST
+      del self._stats
+
+  def isInstrumented(self):
+    """return True if tree is counting comparisons/rotations/etc"""
+    return hasattr(self, "_stats")
+
+  @classmethod
+  def load(cls, filename, aggregate=None):
+    """build a tree from a file written by save()"""
+    with MappedAVLBST(filename) as mapped:
+      return cls.fromSorted(mapped.items(), aggregate)
+
+  def _buildBalanced(self, items, lo, hi):
+    """private helper function: build perfectly balanced subtree of items[lo:hi]"""
+    if lo >= hi:
+      return None
+    mid = (lo + hi) // 2
+    left = self._buildBalanced(items, lo, mid)
+    right = self._buildBalanced(items, mid+1, hi)
+    # left half is never smaller than the right half, so never shorter
+    if left == None:
+      height = 0
+    else:
+      height = left.getHeight() + 1
+    key, value = items[mid]
+    node = self._makeNode(key, value, height, left, right)
+    if self._monoid is not None:
+      self._recalcAgg(node)
+    return node
+
+  def _makeNode(self, key, value, height, left, right):
+    """private helper function: new node (with owner/agg slots if needed)"""
+    if self._owner is None and self._monoid is None:
+      return AVLBSTNode(key, value, height, left, right)
+    return AugmentedAVLBSTNode(key, value, height, left, right, self._owner)
 
   def __repr__(self):
     return "%s()" % (self.__class__.__name__)
@@ -34,156 +152,614 @@ class AVLBST(object):
     return self.size == 0
 
   def insert(self, key, value):
-    """add a new node (key-value pair) to the tree"""
-    if self.size == 0:
-      newnode = AVLBSTNode(key, value, 0)
+    """add a new node (key-value pair) to the tree, return True if added"""
+    # returns False (and changes nothing) if key is already in the tree
+    path, node = self._findPath(key)
+    if node is not None:
+      return False
+    self._insertAt(path, key, value)
+    return True
+
+  def _insertAt(self, path, key, value):
+    """private helper function: add new node below path from _findPath()"""
+    newnode = self._newNode(key, value)
+    self._ownPath(path)
+    self.size += 1
+    self._version += 1
+    if self._minNode is None or key < self._minNode.key:
+      self._minNode = newnode
+    if self._maxNode is None or key > self._maxNode.key:
+      self._maxNode = newnode
+    if len(path) == 0:
       self.root = newnode
-      self.size += 1
-    else:
-      self.root = self._insertInSubtree(self.root, key, value)
-
-  def _insertInSubtree(self, curr, key, value):
-    """private helper function: add new node to correct spot in subtree"""
-    ckey = curr.getKey()
-    if key < ckey:
-      # go left
-      if curr.getLeft() == None:
-        # insert here
-        newnode = AVLBSTNode(key,value,0)
-        curr.setLeft(newnode)
-        self.size += 1
-      else:
-        curr.setLeft(self._insertInSubtree(curr.getLeft(), key, value))
-      self._recalcHeight(curr)
-      curr = self._rebalance(curr)
-      return curr
-    elif key > ckey:
-      # go right
-      if curr.getRight() == None:
-        # insert here
-        newnode = AVLBSTNode(key,value,0)
-        curr.setRight(newnode)
-        self.size += 1
-      else:
-        curr.setRight(self._insertInSubtree(curr.getRight(), key, value))
-      self._recalcHeight(curr)
-      curr = self._rebalance(curr)
-      return curr
+      return newnode
+    parent = path[-1]
+    if key < parent.key:
+      parent.left = newnode
     else:
-      print("insert() error: trying to insert duplicate key (%s)" % str(key))
-      # TODO: should use raise() here???
-      return curr
+      parent.right = newnode
+    self._retrace(path)
+    return newnode
 
   def remove(self, key):
-    """look for key in BST, remove node if found"""
-    self.root = self._removeFromSubtree(self.root, key)
-
-  def _removeFromSubtree(self, curr, key):
-    """private helper function to remove node with key (if found)"""
-    if curr == None:
-      print("remove() error: no such key (%s) to remove." % str(key))
-      return curr
-    elif key < curr.getKey():
-      curr.setLeft(self._removeFromSubtree(curr.getLeft(), key))
-      self._recalcHeight(curr)
-      curr = self._rebalance(curr)
-      return curr
-    elif key > curr.getKey():
-      curr.setRight(self._removeFromSubtree(curr.getRight(), key))
-      self._recalcHeight(curr)
-      curr = self._rebalance(curr)
-      return curr
-    else:
-      # found key....so need to delete this curr node
-      CL = curr.getLeft()
-      CR = curr.getRight()
-      if CL==None and CR==None:
-        # leaf node...easy
-        self.size -= 1
-        return None
-      elif CL==None:
-        # promote the right node
-        self.size -= 1
-        return CR
-      elif CR==None:
-        # promote the left node
-        self.size -= 1
-        return CL
-      else:
-        # find min of right subtree, swap and remove it
-        minright = self._getMinInSubtree(CR)
-        curr.setKey(minright.getKey())
-        curr.setValue(minright.getValue())
-        curr.setRight(self._removeFromSubtree(CR,minright.getKey()))
-        self._recalcHeight(curr)
-        curr = self._rebalance(curr)
-        return curr
+    """look for key in BST, remove node if found; return True if removed"""
+    path, node = self._findPath(key)
+    if node is None:
+      return False
+    self._removeAt(path, node)
+    return True
 
-  def get(self, key):
-    """find node with key, return it's value"""
-    node = self._find(self.root, key)
-    if node == None:
-      print("get() error: no such node with key (%s) to get." % str(key))
-      return None
+  def _removeAt(self, path, node):
+    """private helper function: unlink node found by _findPath()"""
+    if node.left is not None and node.right is not None:
+      # two children: copy successor's key/value here and
+      # unlink the successor (which has no left child) instead
+      target = len(path)
+      path.append(node)
+      succ = node.right
+      while succ.left is not None:
+        path.append(succ)
+        succ = succ.left
+      self._ownPath(path)
+      path[target].key = succ.key
+      path[target].value = succ.value
+      node = succ
+    else:
+      self._ownPath(path)
+    if node.left is None:
+      child = node.right
     else:
-      return node.getValue()
+      child = node.left
+    self.size -= 1
+    self._version += 1
+    if len(path) == 0:
+      self.root = child
+    else:
+      parent = path[-1]
+      if parent.left is node:
+        parent.left = child
+      else:
+        parent.right = child
+      self._retrace(path)
+    if node is self._minNode or node is self._maxNode:
+      self._resetExtremes()
+
+  def _findPath(self, key):
+    """private helper function: return (path, node) for key"""
+    # path is the list of nodes from the root down to (but not including)
+    # the node with key, or to where that node would be inserted
+    path = []
+    curr = self.root
+    while curr is not None:
+      ckey = curr.key
+      if key < ckey:
+        path.append(curr)
+        curr = curr.left
+      elif key > ckey:
+        path.append(curr)
+        curr = curr.right
+      else:
+        return path, curr
+    return path, None
 
-  def update(self, key, value):
-    """find node with key, update it's value"""
+  def _retrace(self, path):
+    """private helper function: fix heights/balance from bottom of path up"""
+    i = len(path) - 1
+    while i >= 0:
+      curr = path[i]
+      oldheight = curr.height
+      self._recalcHeight(curr)
+      sub = self._rebalance(curr)
+      if sub is not curr:
+        if i == 0:
+          self.root = sub
+        else:
+          parent = path[i-1]
+          if parent.left is curr:
+            parent.left = sub
+          else:
+            parent.right = sub
+      if sub.height == oldheight:
+        # subtree height unchanged, so nothing above can need rebalancing;
+        # only the ancestors' subtree sizes still have to be fixed
+        for j in range(i-1, -1, -1):
+          self._recalcSize(path[j])
+        return
+      i -= 1
+
+  def get(self, key, default=None):
+    """find node with key, return it's value (default if not found)"""
     node = self._find(self.root, key)
-    if node == None:
-      print("update() error: no such node with key (%s) to update." % str(key))
-    else:
-      node.setValue(value)
+    if node is None:
+      return default
+    return node.value
+
+  def update(self, *args, **kwargs):
+    """update(key, value): change value of key, return True if found;
+       update(mapping or pairs, **kw): set all those keys, like a dict"""
+    if len(args) != 2 or len(kwargs) > 0:
+      MutableMapping.update(self, *args, **kwargs)
+      return
+    key, value = args
+    path, node = self._findPath(key)
+    if node is None:
+      return False
+    self._setValue(path, node, value)
+    return True
 
   def contains(self, key):
     """return True if key in tree, False if not"""
-    return self._find(self.root, key) != None
+    return self._find(self.root, key) is not None
+
+  # insert-or-update, all with one descent: each returns True if
+  # key was added, False if it was already there (and got changed)
+
+  def upsert(self, key, value):
+    """set value for key, adding key if needed; return True if added"""
+    path, node = self._findPath(key)
+    if node is None:
+      self._insertAt(path, key, value)
+      return True
+    self._setValue(path, node, value)
+    return False
+
+  def compute(self, key, fn, default=None):
+    """set value for key to fn(old value, or default if no key); True if added"""
+    # e.g. counting: tree.compute(word, lambda n: n + 1, 0)
+    path, node = self._findPath(key)
+    if node is None:
+      self._insertAt(path, key, fn(default))
+      return True
+    self._setValue(path, node, fn(node.value))
+    return False
+
+  def merge(self, key, value, fn):
+    """set value for key, or fn(old value, value) if key in tree; True if added"""
+    # e.g. counting: tree.merge(word, 1, operator.add)
+    path, node = self._findPath(key)
+    if node is None:
+      self._insertAt(path, key, value)
+      return True
+    self._setValue(path, node, fn(node.value, value))
+    return False
+
+  def _setValue(self, path, node, value):
+    """private helper function: change value of node found by _findPath()"""
+    # copies the path first if persistent; fixes aggregates up the path
+    path.append(node)
+    path = self._ownPath(path)
+    path[-1].value = value
+    if self._monoid is not None:
+      for i in range(len(path)-1, -1, -1):
+        self._recalcAgg(path[i])
+
+  # dict-style (MutableMapping) interface: misses raise KeyError
+
+  def __getitem__(self, key):
+    """return value for key, KeyError if not found"""
+    node = self._find(self.root, key)
+    if node is None:
+      raise KeyError(key)
+    return node.value
+
+  def __setitem__(self, key, value):
+    """set value for key, adding key if it's not already in the tree"""
+    self.upsert(key, value)
+
+  def __delitem__(self, key):
+    """remove key, KeyError if not found"""
+    path, node = self._findPath(key)
+    if node is None:
+      raise KeyError(key)
+    self._removeAt(path, node)
+
+  def __contains__(self, key):
+    """return True if key in tree, False if not"""
+    return self._find(self.root, key) is not None
+
+  def __eq__(self, other):
+    """equal if same keys, in order, with equal values"""
+    if isinstance(other, AVLBST):
+      if self.size != other.size:
+        return False
+      for mine, theirs in zip(self._iterItems(), other._iterItems()):
+        if mine[0] != theirs[0] or mine[1] != theirs[1]:
+          return False
+      return True
+    return MutableMapping.__eq__(self, other)
+
+  def pop(self, key, default=_MISSING):
+    """remove key, return its value (default, or KeyError, if not found)"""
+    path, node = self._findPath(key)
+    if node is None:
+      if default is _MISSING:
+        raise KeyError(key)
+      return default
+    value = node.value
+    self._removeAt(path, node)
+    return value
+
+  def setdefault(self, key, default=None):
+    """return value for key; if not found, add key with value default"""
+    path, node = self._findPath(key)
+    if node is None:
+      self._insertAt(path, key, default)
+      return default
+    return node.value
+
+  def popitem(self):
+    """remove and return (key,value) pair with smallest key, KeyError if empty"""
+    if self.root is None:
+      raise KeyError("popitem(): tree is empty")
+    return self.popMin()
+
+  def clear(self):
+    """remove all keys"""
+    self._adopt(None)
 
   def _find(self, curr, key):
     """private helper function to find node with key"""
-    if curr == None:
-      return None
-    elif key < curr.getKey():
-      return self._find(curr.getLeft(), key)
-    elif key > curr.getKey():
-      return self._find(curr.getRight(), key)
-    else:
-      return curr
+    while curr is not None:
+      ckey = curr.key
+      if key < ckey:
+        curr = curr.left
+      elif key > ckey:
+        curr = curr.right
+      else:
+        return curr
+    return None
 
   def getKeys(self):
     """return list of all keys, using inorder traversal"""
-    keylist = []
-    def getnodekey(node):
-      keylist.append(node.getKey())
-    self.traverseInOrder(getnodekey)
-    return keylist
+    return [node.key for node in self._iterNodes()]
 
   def getItems(self):
     """return list of all (key,val) tuples, using inorder traversal"""
-    itemlist = []
-    def getnodeitem(node):
-      itemlist.append((node.getKey(),node.getValue()))
-    self.traverseInOrder(getnodeitem)
-    return itemlist
+    return list(self._iterItems())
+
+  def __iter__(self):
+    """iterate over keys in order"""
+    for node in self._iterNodes():
+      yield node.key
+
+  def __reversed__(self):
+    """iterate over keys in reverse order"""
+    for node in self._iterNodes(True):
+      yield node.key
+
+  def keys(self):
+    """return view of keys, in order (reversed() for largest first)"""
+    return AVLBSTKeysView(self)
+
+  def values(self):
+    """return view of values, in key order (reversed() for largest first)"""
+    return AVLBSTValuesView(self)
+
+  def items(self):
+    """return view of (key,value) pairs, in key order (reversed() too)"""
+    return AVLBSTItemsView(self)
+
+  def _iterItems(self, reverse=False):
+    """private helper function: generate (key,value) pairs in order"""
+    # what the tree's own methods use instead of items(), so wrappers
+    # put on items() (like AVLBSTProfiler's) only see outside calls
+    for node in self._iterNodes(reverse):
+      yield (node.key, node.value)
+
+  def floor(self, key):
+    """return (key,value) pair with largest key <= key, or None"""
+    return self._pair(self._floorNode(key, True))
+
+  def ceiling(self, key):
+    """return (key,value) pair with smallest key >= key, or None"""
+    return self._pair(self._ceilingNode(key, True))
+
+  def lower(self, key):
+    """return (key,value) pair with largest key < key, or None"""
+    return self._pair(self._floorNode(key, False))
+
+  def higher(self, key):
+    """return (key,value) pair with smallest key > key, or None"""
+    return self._pair(self._ceilingNode(key, False))
+
+  def cursor(self, key=None):
+    """return cursor at smallest key >= key (smallest key if None)"""
+    cursor = AVLBSTCursor(self)
+    if key is None:
+      cursor.seekFirst()
+    else:
+      cursor.seek(key)
+    return cursor
+
+  def _pair(self, node):
+    """private helper function: (key,value) pair for node, or None"""
+    if node is None:
+      return None
+    return (node.key, node.value)
+
+  def _floorNode(self, key, inclusive):
+    """private helper function: node with largest key <= key (< if not inclusive)"""
+    best = None
+    curr = self.root
+    while curr is not None:
+      if curr.key < key or (inclusive and not key < curr.key):
+        best = curr
+        curr = curr.right
+      else:
+        curr = curr.left
+    return best
+
+  def _ceilingNode(self, key, inclusive):
+    """private helper function: node with smallest key >= key (> if not inclusive)"""
+    best = None
+    curr = self.root
+    while curr is not None:
+      if key < curr.key or (inclusive and not curr.key < key):
+        best = curr
+        curr = curr.left
+      else:
+        curr = curr.right
+    return best
+
+  def rank(self, key):
+    """return number of keys smaller than key, O(log(n))"""
+    return self._countBelow(key, False)
+
+  def countLessThan(self, key):
+    """return number of keys smaller than key, O(log(n))"""
+    return self._countBelow(key, False)
+
+  def _countBelow(self, key, inclusive):
+    """private helper function: number of keys < key (<= if inclusive)"""
+    count = 0
+    curr = self.root
+    while curr is not None:
+      if key < curr.key:
+        curr = curr.left
+      elif key > curr.key:
+        count += 1
+        if curr.left is not None:
+          count += curr.left.size
+        curr = curr.right
+      else:
+        if curr.left is not None:
+          count += curr.left.size
+        if inclusive:
+          count += 1
+        return count
+    return count
+
+  def select(self, i):
+    """return (key,value) pair of i-th smallest key (0=min), O(log(n))"""
+    if i < 0:
+      i += self.size
+    if i < 0 or i >= self.size:
+      raise IndexError("select() error: index out of range (%s)" % str(i))
+    curr = self.root
+    while True:
+      if curr.left is None:
+        leftsize = 0
+      else:
+        leftsize = curr.left.size
+      if i < leftsize:
+        curr = curr.left
+      elif i > leftsize:
+        i -= leftsize + 1
+        curr = curr.right
+      else:
+        return (curr.key, curr.value)
+
+  def islice(self, start=None, stop=None, reverse=False):
+    """generate (key,value) pairs at positions start..stop-1 (like a slice)"""
+    start, stop, step = slice(start, stop).indices(self.size)
+    if start >= stop:
+      return
+    if reverse:
+      nodes = self._iterRange(None, self.select(stop - 1)[0], (True,True), True)
+    else:
+      nodes = self._iterRange(self.select(start)[0], None, (True,True), False)
+    for i in range(stop - start):
+      node = next(nodes)
+      yield (node.key, node.value)
+
+  def median(self):
+    """return (key,value) pair of median key (lower one if size is even)"""
+    if self.size == 0:
+      return None
+    return self.select((self.size - 1) // 2)
+
+  def irange(self, lo=None, hi=None, inclusive=(True,True), reverse=False):
+    """generate keys between lo and hi (None=unbounded), O(log(n)+k)"""
+    for node in self._iterRange(lo, hi, inclusive, reverse):
+      yield node.key
+
+  def irangeItems(self, lo=None, hi=None, inclusive=(True,True), reverse=False):
+    """generate (key,value) pairs for keys between lo and hi"""
+    for node in self._iterRange(lo, hi, inclusive, reverse):
+      yield (node.key, node.value)
+
+  def countRange(self, lo=None, hi=None, inclusive=(True,True)):
+    """return number of keys between lo and hi, O(log(n))"""
+    if hi is None:
+      upper = self.size
+    else:
+      upper = self._countBelow(hi, inclusive[1])
+    if lo is None:
+      lower = 0
+    else:
+      lower = self._countBelow(lo, not inclusive[0])
+    return max(upper - lower, 0)
+
+  def aggregate(self, lo=None, hi=None, inclusive=(True,True)):
+    """return aggregate (e.g. sum) of values for keys between lo and hi, O(log(n))"""
+    # needs a tree made with aggregate=...; empty range: the identity
+    monoid = self._monoid
+    if monoid is None:
+      raise ValueError("aggregate() error: tree keeps no aggregate")
+    if lo is None and hi is None:
+      if self.root is None:
+        return monoid.identity
+      return self.root.agg
+    # find the top-most node in range: the two boundary paths split there
+    split = self.root
+    while split is not None:
+      if not self._aboveLo(split.key, lo, inclusive[0]):
+        split = split.right
+      elif not self._belowHi(split.key, hi, inclusive[1]):
+        split = split.left
+      else:
+        break
+    if split is None:
+      return monoid.identity
+    fn = monoid.fn
+    agg = self._liftValue(split)
+    # left boundary: an in-range node brings its right subtree along
+    curr = split.left
+    while curr is not None:
+      if self._aboveLo(curr.key, lo, inclusive[0]):
+        if curr.right is not None:
+          agg = fn(curr.right.agg, agg)
+        agg = fn(self._liftValue(curr), agg)
+        curr = curr.left
+      else:
+        curr = curr.right
+    # right boundary: an in-range node brings its left subtree along
+    curr = split.right
+    while curr is not None:
+      if self._belowHi(curr.key, hi, inclusive[1]):
+        if curr.left is not None:
+          agg = fn(agg, curr.left.agg)
+        agg = fn(agg, self._liftValue(curr))
+        curr = curr.right
+      else:
+        curr = curr.left
+    return agg
+
+  def _liftValue(self, curr):
+    """private helper function: node's value as a monoid element"""
+    if self._monoid.lift is None:
+      return curr.value
+    return self._monoid.lift(curr.value)
+
+  def deleteRange(self, lo=None, hi=None, inclusive=(True,True)):
+    """remove all keys between lo and hi, return number removed, O(log(n))"""
+    # split out the middle piece and join the two outer pieces back up
+    if lo is not None and hi is not None:
+      # empty interval: the splits below would still take out lo/hi
+      if hi < lo or (not hi > lo and not (inclusive[0] and inclusive[1])):
+        return 0
+    L = None
+    R = self.root
+    if lo is not None:
+      L, found, R = self._split(R, lo)
+      if found is not None and not inclusive[0]:
+        L = self._joinNodes(L, found, None)
+    if hi is None:
+      R = None
+    else:
+      M, found, R = self._split(R, hi)
+      if found is not None and not inclusive[1]:
+        R = self._joinNodes(None, found, R)
+    oldsize = self.size
+    self._adopt(self._join2(L, R))
+    return oldsize - self.size
+
+  def _aboveLo(self, key, lo, inclusive):
+    """private helper function: is key at/above lower bound lo"""
+    if lo is None:
+      return True
+    elif inclusive:
+      return not key < lo
+    else:
+      return lo < key
+
+  def _belowHi(self, key, hi, inclusive):
+    """private helper function: is key at/below upper bound hi"""
+    if hi is None:
+      return True
+    elif inclusive:
+      return not hi < key
+    else:
+      return key < hi
+
+  def _iterRange(self, lo, hi, inclusive, reverse):
+    """private helper function: generate nodes in range, pruning subtrees"""
+    # like _iterNodes, but only nodes inside the start bound are pushed,
+    # and we stop at the first node past the end bound
+    inclo, inchi = inclusive
+    stack = []
+    curr = self.root
+    if reverse:
+      while curr is not None:
+        if self._belowHi(curr.key, hi, inchi):
+          stack.append(curr)
+          curr = curr.right
+        else:
+          curr = curr.left
+      while len(stack) > 0:
+        node = stack.pop()
+        if not self._aboveLo(node.key, lo, inclo):
+          return
+        yield node
+        curr = node.left
+        while curr is not None:
+          stack.append(curr)
+          curr = curr.right
+    else:
+      while curr is not None:
+        if self._aboveLo(curr.key, lo, inclo):
+          stack.append(curr)
+          curr = curr.left
+        else:
+          curr = curr.right
+      while len(stack) > 0:
+        node = stack.pop()
+        if not self._belowHi(node.key, hi, inchi):
+          return
+        yield node
+        curr = node.right
+        while curr is not None:
+          stack.append(curr)
+          curr = curr.left
+
+  def _iterNodes(self, reverse=False):
+    """private helper function: generate nodes in order, O(log(n)) memory"""
+    # explicit stack holds the nodes whose left (right, if reverse)
+    # subtree we're in, so nothing is materialised and no recursion
+    stack = []
+    curr = self.root
+    if reverse:
+      while len(stack) > 0 or curr is not None:
+        while curr is not None:
+          stack.append(curr)
+          curr = curr.right
+        curr = stack.pop()
+        yield curr
+        curr = curr.left
+    else:
+      while len(stack) > 0 or curr is not None:
+        while curr is not None:
+          stack.append(curr)
+          curr = curr.left
+        curr = stack.pop()
+        yield curr
+        curr = curr.right
 
   def _getMinInSubtree(self, curr):
     """get left-most node (should have smallest key)"""
     # since it's a BST, we want the left-most node
     # (assumes BST is correct!)
-    if curr.getLeft()==None:
-      return curr
-    else:
-      return self._getMinInSubtree(curr.getLeft())
+    while curr.left is not None:
+      curr = curr.left
+    return curr
 
   def _getMaxInSubtree(self, curr):
     """get right-most node (should have largest key)"""
     # since it's a BST, we want the right-most node
     # (assumes BST is correct!)
-    if curr.getRight()==None:
-      return curr
-    else:
-      return self._getMaxInSubtree(curr.getRight())
+    while curr.right is not None:
+      curr = curr.right
+    return curr
 
   # AVL rebalance based on info from the wikipedia page:
   # https://en.wikipedia.org/wiki/AVL_tree
@@ -194,309 +770,973 @@ class AVLBST(object):
   # LR: Z is left  child of X, Z is right-heavy
   # first two are handled by "simple" single rotations (left, right)
   # next two are handled by double rotations (rightLeft, leftRight)
+  # heights are recalculated bottom-up: the old root (now a child) first
 
   def _leftRotate(self, X, Z):
     """left-rotate, so Z becomes root, X becomes left-child of Z"""
     # this is the RR case above
-    t23 = Z.getLeft()   # see wikipedia page for X,Z,t23
-    X.setRight(t23)
-    Z.setLeft(X)
+    t23 = Z.left   # see wikipedia page for X,Z,t23
+    X.right = t23
+    Z.left = X
     self._recalcHeight(X)
+    self._recalcHeight(Z)
     return Z
 
   def _rightRotate(self, X, Z):
     """right-rotate, so Z becomes root, X becomes right-child of Z"""
     # this is the LL case above
-    t23 = Z.getRight()
-    X.setLeft(t23)
-    Z.setRight(X)
+    t23 = Z.right
+    X.left = t23
+    Z.right = X
     self._recalcHeight(X)
+    self._recalcHeight(Z)
     return Z
 
   def _rightLeftRotate(self, X, Z):
     """double rotate: first right, then left"""
-    # this is the RL case above
-    Y = Z.getLeft()                  #   X           Y
-    self._rightRotate(Z, Y)          #     Z   --> X   Z
-    X.setRight(Y)                    #   Y
-    self._leftRotate(X, Y)
-    self._recalcHeight(Y)
+    # this is the RL case above, done as one relinking
+    Y = Z.left                       #   X           Y
+    X.right = Y.left                 #     Z   --> X   Z
+    Z.left = Y.right                 #   Y
+    Y.left = X
+    Y.right = Z
     self._recalcHeight(X)
     self._recalcHeight(Z)
+    self._recalcHeight(Y)
     return Y
 
   def _leftRightRotate(self, X, Z):
     """double rotate: first left, then right"""
-    # this is the LR case above
-    Y = Z.getRight()                 #   X          Y
-    self._leftRotate(Z, Y)           # Z     -->  Z   X
-    X.setLeft(Y)                     #   Y
-    self._rightRotate(X, Y)
-    self._recalcHeight(Y)
-    self._recalcHeight(X)
+    # this is the LR case above, done as one relinking
+    Y = Z.right                      #   X          Y
+    Z.right = Y.left                 # Z     -->  Z   X
+    X.left = Y.right                 #   Y
+    Y.left = Z
+    Y.right = X
     self._recalcHeight(Z)
+    self._recalcHeight(X)
+    self._recalcHeight(Y)
     return Y
 
   def _getSubTreeHeight(self, curr):
     """given a node, get height of node's subtree"""
-    if curr == None:
+    if curr is None:
       return 0
     else:
-      return curr.getHeight() + 1
+      return curr.height + 1
 
   def _rebalance(self, curr):
     """given a node in the tree, check if we need to rebalance"""
     # based on code from https://www.cs.swarthmore.edu/courses/CS35/F18/labs/07
-    LSH = self._getSubTreeHeight(curr.getLeft())   # left subtree height
-    RSH = self._getSubTreeHeight(curr.getRight())  # right subtree height
+    LSH = self._getSubTreeHeight(curr.left)   # left subtree height
+    RSH = self._getSubTreeHeight(curr.right)  # right subtree height
     delta = RSH - LSH
     if (delta < -1):
       # left height too big; LLH=left's left height, LRH=left's right height
-      LLH = self._getSubTreeHeight(curr.getLeft().getLeft()) 
-      LRH = self._getSubTreeHeight(curr.getLeft().getRight())
+      Z = curr.left = self._own(curr.left)
+      LLH = self._getSubTreeHeight(Z.left)
+      LRH = self._getSubTreeHeight(Z.right)
       if LLH < LRH:
-        curr = self._leftRightRotate(curr, curr.getLeft())
+        Z.right = self._own(Z.right)
+        curr = self._leftRightRotate(curr, Z)
       else:
-        curr = self._rightRotate(curr, curr.getLeft())
+        curr = self._rightRotate(curr, Z)
     elif (delta > 1):
       # right height too big; RRH=right's right height, RLH=right's left height
-      RRH = self._getSubTreeHeight(curr.getRight().getRight())
-      RLH = self._getSubTreeHeight(curr.getRight().getLeft())
+      Z = curr.right = self._own(curr.right)
+      RRH = self._getSubTreeHeight(Z.right)
+      RLH = self._getSubTreeHeight(Z.left)
       if RLH > RRH:
-        curr = self._rightLeftRotate(curr, curr.getRight())
+        Z.left = self._own(Z.left)
+        curr = self._rightLeftRotate(curr, Z)
       else:
-        curr = self._leftRotate(curr, curr.getRight())
+        curr = self._leftRotate(curr, Z)
     return curr
 
+  # copy-on-write support for persistent trees and snapshots
+
+  def snapshot(self):
+    """return O(1) read-only copy of the tree, sharing all its nodes"""
+    # from now on every node we have is shared with the snapshot, so
+    # take a new owner token: changes will copy the nodes they touch
+    if self._owner is _READONLY:
+      return self
+    snap = self.__class__(aggregate=self._monoid)
+    snap.root = self.root
+    snap.size = self.size
+    snap._minNode = self._minNode
+    snap._maxNode = self._maxNode
+    snap._owner = _READONLY
+    self._owner = object()
+    return snap
+
+  def isReadOnly(self):
+    """return True if this tree is a read-only snapshot"""
+    return self._owner is _READONLY
+
+  def sharedWith(self, other):
+    """return dict with counts of nodes in each tree and nodes shared"""
+    mine = set()
+    for node in self._iterNodes():
+      mine.add(id(node))
+    shared = 0
+    stack = []
+    if other.root is not None:
+      stack.append(other.root)
+    while len(stack) > 0:
+      curr = stack.pop()
+      if id(curr) in mine:
+        # a shared node's whole subtree is shared
+        shared += curr.size
+      else:
+        if curr.left is not None:
+          stack.append(curr.left)
+        if curr.right is not None:
+          stack.append(curr.right)
+    return {"nodes": self.size, "otherNodes": other.size, "shared": shared,
+            "bytesShared": shared * sys.getsizeof(self.root)}
+
+  def _checkWritable(self):
+    """private helper function: complain if this is a read-only snapshot"""
+    if self._owner is _READONLY:
+      raise TypeError("%s snapshot is read-only" % self.__class__.__name__)
+
+  def _newNode(self, key, value):
+    """private helper function: make a new leaf node that we own"""
+    self._checkWritable()
+    node = self._makeNode(key, value, 0, None, None)
+    if self._monoid is not None:
+      self._recalcAgg(node)
+    return node
+
+  def _own(self, node):
+    """private helper function: return node if we own it, else a copy to change"""
+    # (plain nodes, made before a snapshot() made us persistent,
+    # have no owner at all: they're always copied)
+    owner = self._owner
+    if owner is None or node is None or getattr(node, "owner", None) is owner:
+      return node
+    self._checkWritable()
+    self._version += 1
+    copy = AugmentedAVLBSTNode(node.key, node.value, node.height,
+                               node.left, node.right, owner)
+    if self._monoid is not None:
+      copy.agg = node.agg
+    if node is self._minNode:
+      self._minNode = copy
+    if node is self._maxNode:
+      self._maxNode = copy
+    return copy
+
+  def _ownPath(self, path):
+    """private helper function: own every node on a root-down path"""
+    # shared nodes are replaced by copies, relinked into their parents
+    if self._owner is None:
+      return path
+    self._checkWritable()
+    parent = None
+    for i in range(len(path)):
+      node = path[i]
+      copy = self._own(node)
+      if copy is not node:
+        path[i] = copy
+        if parent is None:
+          self.root = copy
+        elif parent.left is node:
+          parent.left = copy
+        else:
+          parent.right = copy
+      parent = path[i]
+    return path
+
+  # join-based split/join and set operations, following
+  # Blelloch, Ferizovic and Sun, "Just Join for Parallel Ordered Sets".
+  # these reuse the nodes of the trees they are given, so the
+  # trees passed in are left empty.
+
+  def copy(self):
+    """return a new tree with the same key-value pairs, O(n)"""
+    return self.__class__.fromSorted(self._iterItems(), self._monoid)
+
+  def split(self, key):
+    """split into two trees (keys < key, keys >= key); empties this tree"""
+    self._checkWritable()
+    work = self._workTree(self)
+    L, found, R = work._split(self.root, key)
+    if found is not None:
+      R = work._joinNodes(None, found, R)
+    self._adopt(None)
+    return work._newTree(L), work._newTree(R)
+
+  @classmethod
+  def join(cls, left, right):
+    """join two trees, all keys in left < all keys in right; empties both"""
+    left._checkWritable()
+    right._checkWritable()
+    if left.size > 0 and right.size > 0 and \
+       not left.findMax().key < right.findMin().key:
+      raise ValueError("join() error: keys in left tree must all be smaller")
+    bst = left._workTree(right)
+    bst._adopt(bst._join2(left.root, right.root))
+    left._adopt(None)
+    right._adopt(None)
+    return bst
+
+  def union(self, other, workers=None):
+    """return tree with keys in either tree (self's values win); empties both"""
+    return self._setOperation("_union", other, workers)
+
+  def intersection(self, other, workers=None):
+    """return tree with keys in both trees (self's values); empties both"""
+    return self._setOperation("_intersection", other, workers)
+
+  def difference(self, other, workers=None):
+    """return tree with keys in self but not in other; empties both"""
+    return self._setOperation("_difference", other, workers)
+
+  def _setOperation(self, op, other, workers):
+    """private helper function: run set operation op, maybe in parallel"""
+    # O(m log(n/m + 1)) for trees of sizes m <= n. with workers > 1 both
+    # trees are cut into key ranges at quantiles of the bigger tree, and
+    # the ranges are handed to a process pool. trees are pickled to and
+    # from the workers, so this only pays off for very large trees.
+    self._checkWritable()
+    other._checkWritable()
+    work = self._workTree(other)
+    if workers != None and workers > 1 and min(self.size, other.size) > 0:
+      if self.size >= other.size:
+        pivots = self._pivots(workers)
+      else:
+        pivots = other._pivots(workers)
+      chunks = zip(self._splitAt(pivots), other._splitAt(pivots))
+      with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_setOperationChunk, op, a, b) for a,b in chunks]
+        results = [f.result() for f in futures]
+      root = None
+      for result in results:
+        root = work._join2(root, result.root)
+    else:
+      root = getattr(work, op)(self.root, other.root)
+    self._adopt(None)
+    other._adopt(None)
+    work._adopt(root)
+    return work
+
+  def _pivots(self, n):
+    """private helper function: keys splitting the tree into n equal parts"""
+    pivots = []
+    for i in range(1, n):
+      key = self.select(i * self.size // n)[0]
+      if len(pivots) == 0 or pivots[-1] < key:
+        pivots.append(key)
+    return pivots
+
+  def _splitAt(self, pivots):
+    """private helper function: split into len(pivots)+1 trees; empties this tree"""
+    trees = []
+    rest = self
+    for pivot in pivots:
+      left, rest = rest.split(pivot)
+      trees.append(left)
+    trees.append(rest)
+    return trees
+
+  def _workTree(self, other):
+    """private helper function: empty tree to build results from self/other in"""
+    # results of persistent trees get a new owner: none of the nodes
+    # they start with are theirs to change, they may be in snapshots
+    if self._monoid is not other._monoid:
+      raise ValueError("trees keep different aggregates")
+    bst = self.__class__(aggregate=self._monoid)
+    if self._owner is not None or other._owner is not None:
+      bst._owner = object()
+    return bst
+
+  def _newTree(self, root):
+    """private helper function: new tree with the same owner holding root"""
+    bst = self.__class__(aggregate=self._monoid)
+    bst._owner = self._owner
+    bst._adopt(root)
+    return bst
+
+  def _adopt(self, root):
+    """private helper function: make root this tree's root"""
+    self._checkWritable()
+    self._version += 1
+    self.root = root
+    if root is None:
+      self.size = 0
+    else:
+      self.size = root.size
+    self._resetExtremes()
+
+  def _union(self, A, B, hits=None):
+    """private helper function: union of subtrees A and B"""
+    # if given, hits collects id()s of the nodes of B whose key is in A
+    if A is None:
+      return B
+    if B is None:
+      return A
+    L, found, R = self._split(B, A.key)
+    if found is not None and hits is not None:
+      hits.add(id(found))
+    left = A.left
+    right = A.right
+    return self._joinNodes(self._union(left, L, hits), A,
+                           self._union(right, R, hits))
+
+  def _intersection(self, A, B):
+    """private helper function: intersection of subtrees A and B"""
+    if A is None or B is None:
+      return None
+    L, found, R = self._split(B, A.key)
+    left = A.left
+    right = A.right
+    L = self._intersection(left, L)
+    R = self._intersection(right, R)
+    if found is None:
+      return self._join2(L, R)
+    return self._joinNodes(L, A, R)
+
+  def _difference(self, A, B, hits=None):
+    """private helper function: subtree A minus keys in subtree B"""
+    # if given, hits collects id()s of the nodes of B whose key was in A
+    if A is None or B is None:
+      return A
+    L, found, R = self._split(A, B.key)
+    if found is not None and hits is not None:
+      hits.add(id(B))
+    left = B.left
+    right = B.right
+    return self._join2(self._difference(L, left, hits),
+                       self._difference(R, right, hits))
+
+  # batch operations: sort the batch once, then handle it in one
+  # coordinated walk of the tree, so neighbouring keys share the
+  # top of their descents. results come back in the caller's order.
+
+  def insertMany(self, items):
+    """insert batch of (key,value) pairs, return list of True/False (inserted)"""
+    # builds a tree of the new keys, then merges it in with _union()
+    self._checkWritable()
+    items = list(items)
+    order = sorted(range(len(items)), key=lambda i: items[i][0])
+    results = [False] * len(items)
+    unique = []
+    owners = []       # index in items of each distinct key (first one wins)
+    for i in order:
+      if len(unique) == 0 or unique[-1][0] < items[i][0]:
+        unique.append(items[i])
+        owners.append(i)
+    if len(unique) * 2 >= self.size:
+      # batch about as big as the tree: a linear merge and an O(n+m)
+      # rebuild beats splitting and joining
+      merged = []
+      j = 0
+      for item in self._iterItems():
+        while j < len(unique) and unique[j][0] < item[0]:
+          merged.append(unique[j])
+          results[owners[j]] = True
+          j += 1
+        if j < len(unique) and not item[0] < unique[j][0]:
+          j += 1        # already in the tree
+        merged.append(item)
+      for j in range(j, len(unique)):
+        merged.append(unique[j])
+        results[owners[j]] = True
+      self._adopt(self._buildBalanced(merged, 0, len(merged)))
+      return results
+    batch = self._newTree(self._buildBalanced(unique, 0, len(unique)))
+    nodes = list(batch._iterNodes())
+    hits = set()
+    self._adopt(self._union(self.root, batch.root, hits))
+    for j in range(len(nodes)):
+      if id(nodes[j]) not in hits:
+        results[owners[j]] = True
+    return results
+
+  def removeMany(self, keys):
+    """remove batch of keys, return list of True/False (removed)"""
+    # builds a tree of the keys, then takes it away with _difference()
+    self._checkWritable()
+    keys = list(keys)
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    results = [False] * len(keys)
+    unique = []
+    owners = []
+    for i in order:
+      if len(unique) == 0 or unique[-1][0] < keys[i]:
+        unique.append((keys[i], None))
+        owners.append(i)
+    if len(unique) * 2 >= self.size:
+      # batch about as big as the tree: filter and rebuild in O(n+m)
+      kept = []
+      j = 0
+      for item in self._iterItems():
+        while j < len(unique) and unique[j][0] < item[0]:
+          j += 1
+        if j < len(unique) and not item[0] < unique[j][0]:
+          results[owners[j]] = True
+        else:
+          kept.append(item)
+      self._adopt(self._buildBalanced(kept, 0, len(kept)))
+      return results
+    # a plain tree: only its keys and shape are used (its values are
+    # all None), so it mustn't keep our aggregates
+    batch = AVLBST.fromSorted(unique)
+    nodes = list(batch._iterNodes())
+    hits = set()
+    self._adopt(self._difference(self.root, batch.root, hits))
+    for j in range(len(nodes)):
+      if id(nodes[j]) in hits:
+        results[owners[j]] = True
+    return results
+
+  def updateMany(self, items):
+    """update values for batch of (key,value) pairs, return list of True/False"""
+    self._checkWritable()
+    items = list(items)
+    order = sorted(range(len(items)), key=lambda i: items[i][0])
+    sortedkeys = [items[i][0] for i in order]
+    results = [False] * len(items)
+    if self._owner is not None or self._monoid is not None:
+      # changed nodes have to be copied along with their paths
+      # (persistent), or their ancestors' aggregates fixed
+      for j in range(len(sortedkeys)):
+        path, node = self._findPath(sortedkeys[j])
+        if node is not None:
+          self._setValue(path, node, items[order[j]][1])
+          results[order[j]] = True
+      return results
+    for j, node in self._matchSorted(sortedkeys):
+      node.value = items[order[j]][1]
+      results[order[j]] = True
+    return results
+
+  def getMany(self, keys, default=None):
+    """return list of values for batch of keys (default if not found)"""
+    keys = list(keys)
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    sortedkeys = [keys[i] for i in order]
+    results = [default] * len(keys)
+    for j, node in self._matchSorted(sortedkeys):
+      results[order[j]] = node.value
+    return results
+
+  def _matchSorted(self, keys):
+    """private helper function: generate (index, node) for sorted keys in tree"""
+    # each stack entry is a subtree and the slice of keys that belong in it
+    stack = []
+    if self.root is not None and len(keys) > 0:
+      stack.append((self.root, 0, len(keys)))
+    while len(stack) > 0:
+      curr, lo, hi = stack.pop()
+      ckey = curr.key
+      i = bisect_left(keys, ckey, lo, hi)
+      j = i
+      while j < hi and not ckey < keys[j]:
+        yield j, curr
+        j += 1
+      if lo < i and curr.left is not None:
+        stack.append((curr.left, lo, i))
+      if j < hi and curr.right is not None:
+        stack.append((curr.right, j, hi))
+
+  def _split(self, curr, key):
+    """private helper function: split subtree into (keys<key, node, keys>key)"""
+    if curr is None:
+      return None, None, None
+    curr = self._own(curr)
+    left = curr.left
+    right = curr.right
+    if key < curr.key:
+      L, found, R = self._split(left, key)
+      return L, found, self._joinNodes(R, curr, right)
+    elif key > curr.key:
+      L, found, R = self._split(right, key)
+      return self._joinNodes(left, curr, L), found, R
+    else:
+      curr.left = None
+      curr.right = None
+      self._recalcHeight(curr)
+      return left, curr, right
+
+  def _join2(self, L, R):
+    """private helper function: join subtrees, all keys in L < all in R"""
+    if L is None:
+      return R
+    L, last = self._splitLast(L)
+    return self._joinNodes(L, last, R)
+
+  def _splitLast(self, curr):
+    """private helper function: detach right-most node, return (rest, node)"""
+    curr = self._own(curr)
+    if curr.right is None:
+      left = curr.left
+      curr.left = None
+      self._recalcHeight(curr)
+      return left, curr
+    rest, last = self._splitLast(curr.right)
+    return self._joinNodes(curr.left, curr, rest), last
+
+  def _joinNodes(self, L, node, R):
+    """private helper function: join L < node < R into one AVL subtree"""
+    node = self._own(node)
+    LSH = self._getSubTreeHeight(L)
+    RSH = self._getSubTreeHeight(R)
+    if LSH > RSH + 1:
+      return self._joinRight(L, node, R)
+    elif RSH > LSH + 1:
+      return self._joinLeft(L, node, R)
+    node.left = L
+    node.right = R
+    self._recalcHeight(node)
+    return node
+
+  def _joinRight(self, L, node, R):
+    """private helper function: join when L is taller, down L's right spine"""
+    L = self._own(L)
+    if self._getSubTreeHeight(L.right) <= self._getSubTreeHeight(R) + 1:
+      node.left = L.right
+      node.right = R
+      self._recalcHeight(node)
+      L.right = node
+    else:
+      L.right = self._joinRight(L.right, node, R)
+    self._recalcHeight(L)
+    return self._rebalance(L)
+
+  def _joinLeft(self, L, node, R):
+    """private helper function: join when R is taller, down R's left spine"""
+    R = self._own(R)
+    if self._getSubTreeHeight(R.left) <= self._getSubTreeHeight(L) + 1:
+      node.left = L
+      node.right = R.left
+      self._recalcHeight(node)
+      R.left = node
+    else:
+      R.left = self._joinLeft(L, node, R.left)
+    self._recalcHeight(R)
+    return self._rebalance(R)
+
   def findMax(self):
     """find and return node with largest key in tree"""
-    return self._findMaxInSubtree(self.root)
+    return self._maxNode
 
   def findMin(self):
     """find and return node with smallest key in tree"""
-    return self._findMinInSubtree(self.root)
+    return self._minNode
 
-  def _findMaxInSubtree(self, curr):
-    """traverse the whole subtree, return node with largest key"""
-    if curr == None:
+  def peekMin(self):
+    """return (key,value) pair with smallest key, or None if empty"""
+    if self._minNode is None:
       return None
-    else:
-      ckey = curr.getKey()
-      Lmax = self._findMaxInSubtree(curr.getLeft())
-      Rmax = self._findMaxInSubtree(curr.getRight())
-      if Lmax==None and Rmax==None:
-        return curr
-      elif Lmax==None:
-        if ckey > Rmax.getKey():
-          return curr
-        else:
-          return Rmax
-      elif Rmax==None:
-        if ckey > Lmax.getKey():
-          return curr
-        else:
-          return Lmax
-      else:
-        rkey = Rmax.getKey()
-        lkey = Lmax.getKey()
-        if ckey > rkey and ckey > lkey:
-          return curr
-        elif rkey > ckey and rkey > lkey:
-          return Rmax
-        else:
-          return Lmax
+    return (self._minNode.key, self._minNode.value)
+
+  def peekMax(self):
+    """return (key,value) pair with largest key, or None if empty"""
+    if self._maxNode is None:
+      return None
+    return (self._maxNode.key, self._maxNode.value)
 
-  def _findMinInSubtree(self, curr):
-    """traverse the whole subtree, return node with smallest key"""
-    if curr == None:
+  def popMin(self):
+    """remove and return (key,value) pair with smallest key, or None if empty"""
+    if self.root is None:
       return None
+    # one walk down the left spine, then unlink (min has no left child)
+    path = []
+    node = self.root
+    while node.left is not None:
+      path.append(node)
+      node = node.left
+    self._ownPath(path)
+    self.size -= 1
+    self._version += 1
+    if len(path) == 0:
+      self.root = node.right
     else:
-      ckey = curr.getKey()
-      Lmin = self._findMinInSubtree(curr.getLeft())
-      Rmin = self._findMinInSubtree(curr.getRight())
-      if Lmin==None and Rmin==None:
-        return curr
-      elif Lmin==None:
-        if ckey < Rmin.getKey():
-          return curr
-        else:
-          return Rmin
-      elif Rmin==None:
-        if ckey < Lmin.getKey():
-          return curr
-        else:
-          return Lmin
-      else:
-        rkey = Rmin.getKey()
-        lkey = Lmin.getKey()
-        if ckey < rkey and ckey < lkey:
-          return curr
-        elif rkey < ckey and rkey < lkey:
-          return Rmin
-        else:
-          return Lmin
+      path[-1].left = node.right
+      self._retrace(path)
+    # next smallest is the popped node's right child (a leaf), or its parent
+    if node.right is not None:
+      self._minNode = node.right
+    elif len(path) > 0:
+      self._minNode = path[-1]
+    else:
+      self._minNode = None
+    if node is self._maxNode:
+      self._maxNode = self._minNode
+    return (node.key, node.value)
 
-  def _countNodes(self, curr):
-    """return number of nodes from here down"""
-    if curr == None:
-      return 0
+  def popMax(self):
+    """remove and return (key,value) pair with largest key, or None if empty"""
+    if self.root is None:
+      return None
+    # one walk down the right spine, then unlink (max has no right child)
+    path = []
+    node = self.root
+    while node.right is not None:
+      path.append(node)
+      node = node.right
+    self._ownPath(path)
+    self.size -= 1
+    self._version += 1
+    if len(path) == 0:
+      self.root = node.left
+    else:
+      path[-1].right = node.left
+      self._retrace(path)
+    # next largest is the popped node's left child (a leaf), or its parent
+    if node.left is not None:
+      self._maxNode = node.left
+    elif len(path) > 0:
+      self._maxNode = path[-1]
     else:
-      return self._countNodes(curr.getLeft()) + \
-             self._countNodes(curr.getRight()) + 1
+      self._maxNode = None
+    if node is self._minNode:
+      self._minNode = self._maxNode
+    return (node.key, node.value)
 
-  def _checkKeys(self, curr):
-    """check that keys are all in order for BST"""
-    if curr == None:
-      return True
+  def popMinBatch(self, k):
+    """remove and return list of (key,value) pairs for k smallest keys"""
+    batch = []
+    while len(batch) < k and self.root is not None:
+      batch.append(self.popMin())
+    return batch
+
+  def popMaxBatch(self, k):
+    """remove and return list of (key,value) pairs for k largest keys"""
+    batch = []
+    while len(batch) < k and self.root is not None:
+      batch.append(self.popMax())
+    return batch
+
+  def _resetExtremes(self):
+    """private helper function: recompute cached min/max nodes"""
+    if self.root is None:
+      self._minNode = None
+      self._maxNode = None
     else:
-      minRight = self._findMinInSubtree(curr.getRight())
-      maxLeft = self._findMaxInSubtree(curr.getLeft())
-      if minRight==None and maxLeft==None:
-        return True
-      elif minRight==None:
-        return curr.getKey() > maxLeft.getKey()
-      elif maxLeft==None:
-        return curr.getKey() < minRight.getKey()
-      else:
-        return maxLeft.getKey() < curr.getKey() and \
-                  curr.getKey() < minRight.getKey()
+      self._minNode = self._getMinInSubtree(self.root)
+      self._maxNode = self._getMaxInSubtree(self.root)
 
-  def checkInvariants(self):
-    """check the BST to make sure it's valid"""
+  def checkInvariants(self, samples=None):
+    """check the BST to make sure it's valid (samples=N: check N random paths)"""
     # based on code from https://www.cs.swarthmore.edu/courses/CS35/F18/labs/07
+    # one O(n) pass: every key must lie between the bounds set by its
+    # ancestors, every stored height must be one more than the taller
+    # child's, and child heights can differ by at most one.
+    # for testing when not valid:
+    # self.root.setKey("Z")
+    if samples != None:
+      return self._checkSampledPaths(samples)
+    count = 0
+    stack = []
+    if self.root != None:
+      stack.append((self.root, None, None))
+    while len(stack) > 0:
+      curr, lo, hi = stack.pop()
+      count += 1
+      error = self._checkNode(curr, lo, hi)
+      if error != None:
+        print(error)
+        return False
+      if curr.left != None:
+        stack.append((curr.left, lo, curr))
+      if curr.right != None:
+        stack.append((curr.right, curr, hi))
     # make sure size is correct
-    count = self._countNodes(self.root)
     if count != self.size:
       print("BST size incorrect!!!")
       return False
-    # make sure max of left < key < min of right for all nodes.
-    # warning...I think this is an O(nlog(n)) algorithm, since for every node,
-    # you need to visit all nodes below (to find the min/max).
-    # for testing when not valid: 
-    # self.root.setKey("Z")
-    if not self._checkKeys(self.root):
-      print("BST keys out of order!!!")
+    # make sure cached min/max nodes are the left-most/right-most ones
+    if self.root == None:
+      minnode = maxnode = None
+    else:
+      minnode = self._getMinInSubtree(self.root)
+      maxnode = self._getMaxInSubtree(self.root)
+    if self._minNode is not minnode or self._maxNode is not maxnode:
+      print("BST cached min/max incorrect!!!")
       return False
     # all good if we get here...
     return True
 
+  def _checkSampledPaths(self, samples):
+    """check nodes on randomly chosen root-to-leaf paths, O(samples*log(n))"""
+    # cheap enough to run in production; can't check size this way
+    for i in range(samples):
+      curr = self.root
+      lo = None
+      hi = None
+      while curr != None:
+        error = self._checkNode(curr, lo, hi)
+        if error != None:
+          print(error)
+          return False
+        if curr.right == None or (curr.left != None and random.random() < 0.5):
+          hi = curr
+          curr = curr.left
+        else:
+          lo = curr
+          curr = curr.right
+    return True
+
+  def _checkNode(self, curr, lo, hi):
+    """private helper function: check one node, return error message or None"""
+    # lo/hi are the nearest ancestors the key must lie between (None=no bound)
+    key = curr.key
+    if (lo != None and not lo.key < key) or (hi != None and not key < hi.key):
+      return "BST keys out of order!!!"
+    LSH = self._getSubTreeHeight(curr.left)
+    RSH = self._getSubTreeHeight(curr.right)
+    if curr.height != max(LSH, RSH):
+      return "AVL heights incorrect!!!"
+    if abs(RSH - LSH) > 1:
+      return "AVL tree out of balance!!!"
+    size = 1
+    if curr.left != None:
+      size += curr.left.size
+    if curr.right != None:
+      size += curr.right.size
+    if curr.size != size:
+      return "BST subtree sizes incorrect!!!"
+    if self._monoid is not None and curr.agg != self._aggOf(curr):
+      return "BST subtree aggregates incorrect!!!"
+    return None
+
   def traverseInOrder(self, f):
     """in-order traversal: apply function f(node) to each node"""
     if callable(f):
-      self._traverseInOrder(self.root, f)
+      for node in self._iterNodes():
+        f(node)
     else:
       print("traverseInOrder(f) error: f must be a callable function")
 
-  def _traverseInOrder(self, curr, f):
-    """private helper function to apply f during in-order traversal"""
-    if curr == None:
-      return
-    else:
-      self._traverseInOrder(curr.getLeft(), f)
-      f(curr)
-      self._traverseInOrder(curr.getRight(), f)
-
   def traversePreOrder(self, f):
     """pre-order traversal: apply function f(node) to each node"""
     if callable(f):
-      self._traversePreOrder(self.root, f)
+      stack = []
+      if self.root is not None:
+        stack.append(self.root)
+      while len(stack) > 0:
+        curr = stack.pop()
+        f(curr)
+        # push right first, so left subtree is visited first
+        if curr.right is not None:
+          stack.append(curr.right)
+        if curr.left is not None:
+          stack.append(curr.left)
     else:
       print("traversePreOrder(f) error: f must be a callable function")
 
-  def _traversePreOrder(self, curr, f):
-    """private helper function to apply f during pre-order traversal"""
-    if curr == None:
-      return
-    else:
-      f(curr)
-      self._traversePreOrder(curr.getLeft(), f)
-      self._traversePreOrder(curr.getRight(), f)
-
   def traversePostOrder(self, f):
     """post-order traversal: apply function f(node) to each node"""
     if callable(f):
-      self._traversePostOrder(self.root, f)
+      stack = []
+      last = None       # last node visited
+      curr = self.root
+      while len(stack) > 0 or curr is not None:
+        if curr is not None:
+          stack.append(curr)
+          curr = curr.left
+        else:
+          top = stack[-1]
+          if top.right is not None and top.right is not last:
+            curr = top.right
+          else:
+            f(top)
+            last = stack.pop()
     else:
       print("traversePostOrder(f) error: f must be a callable function")
 
-  def _traversePostOrder(self, curr, f):
-    """private helper function to apply f during post-order traversal"""
-    if curr == None:
-      return
-    else:
-      self._traversePostOrder(curr.getLeft(), f)
-      self._traversePostOrder(curr.getRight(), f)
-      f(curr)
-
   def traverseLevelOrder(self):
     """return level-by-level order list of (key,value) pairs"""
-    pairs = []
-    # use queue to store nodes in correct order
-    q = queue.Queue()   
-    if self.root != None:
-      q.put(self.root)
-      while not q.empty():
-        curr = q.get()
-        pairs.append((curr.getKey(), curr.getValue()))
-        if curr.getLeft() != None:
-          q.put(curr.getLeft())
-        if curr.getRight() != None:
-          q.put(curr.getRight())
-    return pairs
+    return list(self._iterLevelOrder())
+
+  def iterLevelOrder(self):
+    """generate (key,value) pairs level by level (root first), lazily"""
+    return self._iterLevelOrder()
+
+  def _iterLevelOrder(self):
+    """private helper function: generate pairs level by level"""
+    # a deque is a plain FIFO here: queue.Queue locks on every put/get
+    if self.root is None:
+      return
+    q = deque([self.root])
+    while len(q) > 0:
+      curr = q.popleft()
+      yield (curr.key, curr.value)
+      if curr.left is not None:
+        q.append(curr.left)
+      if curr.right is not None:
+        q.append(curr.right)
+
+  def iterLevels(self, maxDepth=None):
+    """generate one list of (key,value) pairs per level, down to maxDepth"""
+    # maxDepth 0 is just the root; nodes below maxDepth are never visited
+    level = []
+    if self.root is not None:
+      level.append(self.root)
+    depth = 0
+    while len(level) > 0 and (maxDepth is None or depth <= maxDepth):
+      yield [(node.key, node.value) for node in level]
+      below = []
+      for node in level:
+        if node.left is not None:
+          below.append(node.left)
+        if node.right is not None:
+          below.append(node.right)
+      level = below
+      depth += 1
 
   def _recalcHeight(self, curr):
-    """calculate/set height of given node"""
-    if curr.getLeft() == None:
+    """calculate/set height (and subtree size) of given node"""
+    left = curr.left
+    right = curr.right
+    size = 1
+    if left is None:
       lefth = -1
     else:
-      lefth = curr.getLeft().getHeight()
-    if curr.getRight() == None:
+      lefth = left.height
+      size += left.size
+    if right is None:
       righth = -1
     else:
-      righth = curr.getRight().getHeight()
-    curr.setHeight(max(lefth,righth) + 1)
+      righth = right.height
+      size += right.size
+    curr.size = size
+    if lefth > righth:
+      curr.height = lefth + 1
+    else:
+      curr.height = righth + 1
+    if self._monoid is not None:
+      self._recalcAgg(curr)
+
+  def _recalcSize(self, curr):
+    """calculate/set subtree size (and aggregate) of given node"""
+    size = 1
+    if curr.left is not None:
+      size += curr.left.size
+    if curr.right is not None:
+      size += curr.right.size
+    curr.size = size
+    if self._monoid is not None:
+      self._recalcAgg(curr)
+
+  def _recalcAgg(self, curr):
+    """calculate/set aggregate of values in given node's subtree"""
+    curr.agg = self._aggOf(curr)
+
+  def _aggOf(self, curr):
+    """private helper function: aggregate of node's value and children's aggs"""
+    fn = self._monoid.fn
+    agg = self._liftValue(curr)
+    if curr.left is not None:
+      agg = fn(curr.left.agg, agg)
+    if curr.right is not None:
+      agg = fn(agg, curr.right.agg)
+    return agg
 
 #https://eli.thegreenplace.net/2009/11/23/visualizing-binary-trees-with-graphviz
 
-  def writeDotFile(self, filename):
-    """make xdot file, so we can actually *see* the tree"""
-    nullcount = 0
+  def writeDotFile(self, filename, maxDepth=None, maxNodes=None, nulls=True):
+    """make xdot file, so we can actually *see* the tree; False if can't"""
     try:
-      ofl = open(filename,"w")
-    except:
-      print("writeDotFile() unable to open file (%s)...exiting now." % filename)
-      sys.exit(1)
-    ofl.write("digraph BST {\n")
-    ofl.write("   node [fontname=\"Arial\"];\n")
-    if self.root == None:
-      ofl.write("\n")
-    elif self.root.getLeft()==None and self.root.getRight()==None:
-      ofl.write("    %s;\n" % (self.root.getDesc()))
-    else:
-      self._helperDot(self.root, ofl, nullcount)
-    ofl.write("}\n")
-    ofl.close()
-
-  def _helperDot(self, curr, ofl, nullcount):
-    """private helper function for writing out xdot file"""
-    if curr.getLeft() != None:
-      ofl.write("   %s -> %s ;\n" % (curr.getDesc(),curr.getLeft().getDesc()))
-      nullcount = self._helperDot(curr.getLeft(), ofl, nullcount)
-    else:
-      nullcount += 1
-      self._nullDot(curr.getDesc(), nullcount, ofl)
-    if curr.getRight() != None:
-      ofl.write("   %s -> %s ;\n" % (curr.getDesc(),curr.getRight().getDesc()))
-      nullcount = self._helperDot(curr.getRight(), ofl, nullcount)
-    else:
-      nullcount += 1
-      self._nullDot(curr.getDesc(), nullcount, ofl)
-    return nullcount
-
-  def _nullDot(self, description, nullcount, ofl):
-    """private helper function to write null nodes"""
-    ofl.write("   null%d [shape=point];\n" % nullcount)
-    ofl.write("   %s -> null%d;\n" % (description,nullcount))
+      ofl = open(filename, "w")
+    except OSError:
+      print("writeDotFile() unable to open file (%s)" % filename)
+      return False
+    with ofl:
+      self.writeDot(ofl, maxDepth, maxNodes, nulls)
+    return True
+
+  def writeDot(self, ofl, maxDepth=None, maxNodes=None, nulls=True):
+    """write dotLines() to file-like ofl, in large buffered chunks"""
+    chunk = []
+    for line in self.dotLines(maxDepth, maxNodes, nulls):
+      chunk.append(line)
+      if len(chunk) >= 4096:
+        ofl.write("".join(chunk))
+        chunk = []
+    ofl.write("".join(chunk))
+
+  def dotLines(self, maxDepth=None, maxNodes=None, nulls=True):
+    """generate lines of dot file for the tree (see writeDotFile())"""
+    # subtrees below maxDepth (0=root only), or beyond the first maxNodes
+    # nodes (whole levels, top down), are drawn as one summary box each;
+    # nulls=False leaves out the dots for missing children
+    if maxNodes is not None:
+      maxDepth = self._dotDepth(maxDepth, maxNodes)
+    yield "digraph BST {\n"
+    yield "   node [fontname=\"Arial\"];\n"
+    root = self.root
+    summaries = 0
+    nullcount = 0
+    if root is None:
+      yield "\n"
+    elif maxDepth is not None and maxDepth < 0:
+      yield self._dotSummary(root, "sub1")
+    elif root.left is None and root.right is None:
+      yield "    %s;\n" % (root.getDesc())
+    else:
+      # explicit stack of (node, depth, side to do): for each node
+      # its left child's whole subtree is written before its right edge
+      stack = [(root, 0, "left")]
+      while len(stack) > 0:
+        curr, depth, side = stack.pop()
+        desc = curr.getDesc()
+        if side == "left":
+          stack.append((curr, depth, "right"))
+          child = curr.left
+        else:
+          child = curr.right
+        if child is None:
+          if nulls:
+            nullcount += 1
+            yield "   null%d [shape=point];\n" % nullcount
+            yield "   %s -> null%d;\n" % (desc, nullcount)
+        elif maxDepth is not None and depth >= maxDepth:
+          summaries += 1
+          name = "sub%d" % summaries
+          yield self._dotSummary(child, name)
+          yield "   %s -> %s;\n" % (desc, name)
+        else:
+          yield "   %s -> %s ;\n" % (desc, child.getDesc())
+          stack.append((child, depth + 1, "left"))
+    yield "}\n"
+
+  def _dotDepth(self, maxDepth, maxNodes):
+    """private helper function: deepest depth with at most maxNodes above"""
+    depth = -1
+    total = 0
+    level = []
+    if self.root is not None:
+      level.append(self.root)
+    while len(level) > 0 and total + len(level) <= maxNodes:
+      if maxDepth is not None and depth >= maxDepth:
+        break
+      total += len(level)
+      depth += 1
+      below = []
+      for node in level:
+        if node.left is not None:
+          below.append(node.left)
+        if node.right is not None:
+          below.append(node.right)
+      level = below
+    return depth
+
+  def _dotSummary(self, curr, name):
+    """private helper function: dot line for box standing in for subtree"""
+    lo = self._getMinInSubtree(curr).key
+    hi = self._getMaxInSubtree(curr).key
+    return "   %s [shape=box,label=\"%d keys, height %d\\n%s .. %s\"];\n" % \
+           (name, curr.size, curr.height, str(lo), str(hi))
+
+def _setOperationChunk(op, A, B):
+  """run set operation op on one pair of trees (in a worker process)"""
+  A._adopt(getattr(A, op)(A.root, B.root))
+  return A
 
 # ---------------------------------------------- #
 
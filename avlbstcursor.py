@@ -0,0 +1,147 @@
+"""
+AVL BinarySearchTree Cursor Class
+
+A cursor marks a position (a key) in an AVLBST and can step to
+the next or previous key. It keeps the path of nodes from the
+root down to its current node, so seeking is O(log(n)) and each
+step is O(1) amortised (a whole scan of k keys is O(log(n) + k)).
+
+If the tree changes shape after the cursor was positioned (insert,
+remove, split, ...) the saved path may be wrong, so the cursor
+raises RuntimeError instead of walking it. Call seek() again, or
+change the tree with the cursor's own delete().
+"""
+
+class AVLBSTCursor(object):
+
+  def __init__(self, tree):
+    """cursor constructor: not positioned anywhere yet"""
+    self.tree = tree
+    self._path = []       # root down to current node; empty = off the end
+    self._version = tree._version
+
+  def __repr__(self):
+    return "%s(%r)" % (self.__class__.__name__, self.tree)
+  def __str__(self):
+    return "Cursor at: %s" % str(self.current())
+
+  def seek(self, key):
+    """move to smallest key >= key, return (key,value) or None"""
+    self._version = self.tree._version
+    path = []
+    best = 0          # path length up to the best node so far
+    curr = self.tree.root
+    while curr is not None:
+      path.append(curr)
+      if key < curr.key:
+        best = len(path)
+        curr = curr.left
+      elif key > curr.key:
+        curr = curr.right
+      else:
+        best = len(path)
+        break
+    del path[best:]
+    self._path = path
+    return self.current()
+
+  def seekFirst(self):
+    """move to smallest key, return (key,value) or None"""
+    self._version = self.tree._version
+    self._path = []
+    self._pushLeft(self.tree.root)
+    return self.current()
+
+  def seekLast(self):
+    """move to largest key, return (key,value) or None"""
+    self._version = self.tree._version
+    self._path = []
+    self._pushRight(self.tree.root)
+    return self.current()
+
+  def isValid(self):
+    """return True if cursor is at a key, and the tree hasn't changed"""
+    return len(self._path) > 0 and self._version == self.tree._version
+
+  def current(self):
+    """return (key,value) pair at cursor, or None if off the end"""
+    self._check()
+    if len(self._path) == 0:
+      return None
+    node = self._path[-1]
+    return (node.key, node.value)
+
+  def next(self):
+    """move to next larger key, return (key,value) or None at the end"""
+    self._check()
+    path = self._path
+    if len(path) == 0:
+      return None
+    node = path[-1]
+    if node.right is not None:
+      self._pushLeft(node.right)
+    else:
+      # go up until we come from a left child
+      child = path.pop()
+      while len(path) > 0 and path[-1].right is child:
+        child = path.pop()
+    return self.current()
+
+  def prev(self):
+    """move to next smaller key, return (key,value) or None at the start"""
+    self._check()
+    path = self._path
+    if len(path) == 0:
+      return None
+    node = path[-1]
+    if node.left is not None:
+      self._pushRight(node.left)
+    else:
+      # go up until we come from a right child
+      child = path.pop()
+      while len(path) > 0 and path[-1].left is child:
+        child = path.pop()
+    return self.current()
+
+  def delete(self):
+    """remove key at cursor from tree, move to next key; return it or None"""
+    pair = self.current()
+    if pair is None:
+      return None
+    self.tree.remove(pair[0])
+    return self.seek(pair[0])
+
+  def _check(self):
+    """private helper function: complain if tree changed under us"""
+    if self._version != self.tree._version:
+      raise RuntimeError("tree changed since cursor was positioned")
+
+  def _pushLeft(self, curr):
+    """private helper function: push curr and its left spine"""
+    while curr is not None:
+      self._path.append(curr)
+      curr = curr.left
+
+  def _pushRight(self, curr):
+    """private helper function: push curr and its right spine"""
+    while curr is not None:
+      self._path.append(curr)
+      curr = curr.right
+
+# ---------------------------------------------- #
+
+def main():
+  """some simple test code"""
+  from avlbst import AVLBST
+  bst = AVLBST.fromSorted([(i, i*i) for i in range(10)])
+  c = bst.cursor(4)
+  print(c)
+  print(c.next(), c.next(), c.prev())
+  print(c.delete(), bst.getKeys())
+  c.seekLast()
+  while c.isValid():
+    print(c.current())
+    c.prev()
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,40 @@
+"""
+Monoids for AVLBST aggregates
+
+A Monoid combines values with an associative function fn (so
+fn(fn(a, b), c) == fn(a, fn(b, c)): it doesn't matter how the
+values are grouped) and has an identity: the aggregate of no
+values at all.
+An AVLBST built with one keeps, in every node, the aggregate of
+all the values in that node's subtree (after lift(), if given, is
+applied to each value), which lets AVLBST.aggregate(lo, hi) answer
+range queries in O(log(n)).
+
+fn doesn't have to be commutative: subtrees are always combined
+in key order.
+"""
+
+import operator
+
+class Monoid(object):
+
+  def __init__(self, fn, identity=None, lift=None):
+    """monoid constructor: associative fn(a, b), identity, value -> element"""
+    self.fn = fn
+    self.identity = identity
+    self.lift = lift
+
+  def __repr__(self):
+    return "%s(%r, %r)" % (self.__class__.__name__, self.fn, self.identity)
+
+def _one(value):
+  """every value counts as 1"""
+  return 1
+
+SUM = Monoid(operator.add, 0)
+COUNT = Monoid(operator.add, 0, _one)
+MIN = Monoid(min)
+MAX = Monoid(max)
+
+# names that can be given instead of a Monoid
+MONOIDS = {"sum": SUM, "count": COUNT, "min": MIN, "max": MAX}
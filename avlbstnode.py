@@ -3,7 +3,13 @@ AVL BinarySearchTree Node Class
 
 Nodes to be used in AVLBST. Each node stores data
 as a key-value pair. Nodes also store left and right
-pointers and their current height in the tree.
+pointers, their current height in the tree, and the
+number of nodes in their subtree (for rank/select).
+
+Persistent trees and trees with an aggregate use
+AugmentedAVLBSTNode instead, which also records which tree
+"owns" the node (see AVLBST.snapshot()) and the aggregate of its
+subtree's values. Plain trees don't pay for those two slots.
 
 J. Knerr
 Fall 2018
@@ -11,6 +17,9 @@ Fall 2018
 
 class AVLBSTNode(object):
 
+  # no per-node __dict__: saves a lot of memory on big trees
+  __slots__ = ("key", "value", "height", "left", "right", "size")
+
   def __init__(self,key,value,height=-1,left=None,right=None):
     """node constructor:key,value,height,left,right"""
     self.key = key
@@ -18,6 +27,11 @@ class AVLBSTNode(object):
     self.height = height
     self.left = left
     self.right = right
+    self.size = 1
+    if left != None:
+      self.size += left.size
+    if right != None:
+      self.size += right.size
 
   def __repr__(self):
     """goal is to be unambiguous"""
@@ -42,6 +56,9 @@ class AVLBSTNode(object):
   def getHeight(self): 
     """get height of node (-1=undef)"""
     return self.height
+  def getSize(self):
+    """get number of nodes in this node's subtree"""
+    return self.size
   def getLeft(self):   
     """get left pointer from node"""
     return self.left
@@ -70,6 +87,17 @@ class AVLBSTNode(object):
     """set right pointer"""
     self.right = node
 
+class AugmentedAVLBSTNode(AVLBSTNode):
+
+  # only for persistent trees and trees with an aggregate
+  __slots__ = ("owner", "agg")
+
+  def __init__(self,key,value,height=-1,left=None,right=None,owner=None):
+    """node constructor:key,value,height,left,right,owner"""
+    AVLBSTNode.__init__(self,key,value,height,left,right)
+    self.owner = owner
+    self.agg = None       # set by trees that keep aggregates
+
 # ---------------------------------------------- #
 
 def main():
@@ -84,7 +112,11 @@ def main():
   assert(n2.getHeight()==3)
   assert(n2.getLeft()==None)
   assert(n2.getRight().getHeight()==-1)
+  assert(n2.getSize()==2)
   assert(n2.getDesc()=='"5(3)"')
+  n3 = AugmentedAVLBSTNode(7,"bye",4,n2,None,"me")
+  assert(n3.owner=="me")
+  assert(n3.getSize()==3)
 
 if __name__ == "__main__":
   main()
@@ -0,0 +1,334 @@
+"""
+AVL BinarySearchTree backed by a node pool
+
+Same AVL algorithms as AVLBST, but there are no node objects:
+a node is an integer index into parallel arrays of keys, values,
+left/right children and heights. Child links and heights are
+stored in typed arrays (a few bytes each) instead of as attributes
+of a python object, which is much smaller for very big trees.
+
+run python3 avlbstpool.py [n] for a memory-usage report
+"""
+
+from array import array
+import sys
+
+NULL = -1   # index used for "no node"
+
+class AVLBSTPool(object):
+
+  def __init__(self):
+    """avlbstpool constructor: creates initially empty tree"""
+    self.size = 0
+    self.root = NULL
+    self.keys = []
+    self.values = []
+    self.left = array("i")
+    self.right = array("i")
+    self.height = array("b")    # AVL height is always < 128
+    self.free = []              # indices of removed nodes, for reuse
+
+  def __repr__(self):
+    return "%s()" % (self.__class__.__name__)
+  def __str__(self):
+    return "Size: %d, Capacity: %d" % (self.size, len(self.keys))
+
+  def getSize(self):
+    """return size of tree"""
+    return self.size
+  def __len__(self):
+    """return size of tree"""
+    return self.size
+  def isEmpty(self):
+    """return True if tree is empty, False if not"""
+    return self.size == 0
+
+  def _newNode(self, key, value):
+    """private helper function: allocate a leaf node, return its index"""
+    if len(self.free) > 0:
+      i = self.free.pop()
+      self.keys[i] = key
+      self.values[i] = value
+      self.left[i] = NULL
+      self.right[i] = NULL
+      self.height[i] = 0
+    else:
+      i = len(self.keys)
+      self.keys.append(key)
+      self.values.append(value)
+      self.left.append(NULL)
+      self.right.append(NULL)
+      self.height.append(0)
+    return i
+
+  def _freeNode(self, i):
+    """private helper function: put node back in the pool"""
+    self.keys[i] = None
+    self.values[i] = None
+    self.free.append(i)
+
+  def insert(self, key, value):
+    """add a new node (key-value pair) to the tree, return True if added"""
+    # returns False (and changes nothing) if key is already in the tree
+    path, node = self._findPath(key)
+    if node != NULL:
+      return False
+    newnode = self._newNode(key, value)
+    self.size += 1
+    if len(path) == 0:
+      self.root = newnode
+      return True
+    parent = path[-1]
+    if key < self.keys[parent]:
+      self.left[parent] = newnode
+    else:
+      self.right[parent] = newnode
+    self._retrace(path)
+    return True
+
+  def remove(self, key):
+    """look for key in tree, remove node if found; return True if removed"""
+    path, node = self._findPath(key)
+    if node == NULL:
+      return False
+    left = self.left
+    right = self.right
+    if left[node] != NULL and right[node] != NULL:
+      # two children: move successor's key/value here, unlink successor
+      path.append(node)
+      succ = right[node]
+      while left[succ] != NULL:
+        path.append(succ)
+        succ = left[succ]
+      self.keys[node] = self.keys[succ]
+      self.values[node] = self.values[succ]
+      node = succ
+    if left[node] == NULL:
+      child = right[node]
+    else:
+      child = left[node]
+    self.size -= 1
+    if len(path) == 0:
+      self.root = child
+    else:
+      parent = path[-1]
+      if left[parent] == node:
+        left[parent] = child
+      else:
+        right[parent] = child
+      self._retrace(path)
+    self._freeNode(node)
+    return True
+
+  def get(self, key, default=None):
+    """find node with key, return it's value (default if not found)"""
+    node = self._find(key)
+    if node == NULL:
+      return default
+    return self.values[node]
+
+  def update(self, key, value):
+    """find node with key, change it's value; return True if found"""
+    node = self._find(key)
+    if node == NULL:
+      return False
+    self.values[node] = value
+    return True
+
+  def contains(self, key):
+    """return True if key in tree, False if not"""
+    return self._find(key) != NULL
+
+  def _find(self, key):
+    """private helper function to find index of node with key"""
+    keys = self.keys
+    left = self.left
+    right = self.right
+    curr = self.root
+    while curr != NULL:
+      ckey = keys[curr]
+      if key < ckey:
+        curr = left[curr]
+      elif key > ckey:
+        curr = right[curr]
+      else:
+        return curr
+    return NULL
+
+  def _findPath(self, key):
+    """private helper function: return (path, node) for key"""
+    keys = self.keys
+    path = []
+    curr = self.root
+    while curr != NULL:
+      ckey = keys[curr]
+      if key < ckey:
+        path.append(curr)
+        curr = self.left[curr]
+      elif key > ckey:
+        path.append(curr)
+        curr = self.right[curr]
+      else:
+        return path, curr
+    return path, NULL
+
+  def getKeys(self):
+    """return list of all keys, in order"""
+    return [self.keys[i] for i in self._inOrder()]
+
+  def getItems(self):
+    """return list of all (key,val) tuples, in order"""
+    return [(self.keys[i], self.values[i]) for i in self._inOrder()]
+
+  def _inOrder(self):
+    """private helper function: generate node indices in key order"""
+    stack = []
+    curr = self.root
+    while len(stack) > 0 or curr != NULL:
+      while curr != NULL:
+        stack.append(curr)
+        curr = self.left[curr]
+      curr = stack.pop()
+      yield curr
+      curr = self.right[curr]
+
+  def _retrace(self, path):
+    """private helper function: fix heights/balance from bottom of path up"""
+    i = len(path) - 1
+    while i >= 0:
+      curr = path[i]
+      oldheight = self.height[curr]
+      self._recalcHeight(curr)
+      sub = self._rebalance(curr)
+      if sub != curr:
+        if i == 0:
+          self.root = sub
+        else:
+          parent = path[i-1]
+          if self.left[parent] == curr:
+            self.left[parent] = sub
+          else:
+            self.right[parent] = sub
+      if self.height[sub] == oldheight:
+        return
+      i -= 1
+
+  def _subTreeHeight(self, i):
+    """given a node index, get height of node's subtree"""
+    if i == NULL:
+      return 0
+    return self.height[i] + 1
+
+  def _recalcHeight(self, i):
+    """calculate/set height of given node"""
+    self.height[i] = max(self._subTreeHeight(self.left[i]),
+                         self._subTreeHeight(self.right[i]))
+
+  def _leftRotate(self, X, Z):
+    """left-rotate, so Z becomes root, X becomes left-child of Z"""
+    self.right[X] = self.left[Z]
+    self.left[Z] = X
+    self._recalcHeight(X)
+    self._recalcHeight(Z)
+    return Z
+
+  def _rightRotate(self, X, Z):
+    """right-rotate, so Z becomes root, X becomes right-child of Z"""
+    self.left[X] = self.right[Z]
+    self.right[Z] = X
+    self._recalcHeight(X)
+    self._recalcHeight(Z)
+    return Z
+
+  def _rebalance(self, curr):
+    """given a node in the tree, check if we need to rebalance"""
+    left = self.left
+    right = self.right
+    delta = self._subTreeHeight(right[curr]) - self._subTreeHeight(left[curr])
+    if delta < -1:
+      Z = left[curr]
+      if self._subTreeHeight(left[Z]) < self._subTreeHeight(right[Z]):
+        left[curr] = self._leftRotate(Z, right[Z])
+      return self._rightRotate(curr, left[curr])
+    elif delta > 1:
+      Z = right[curr]
+      if self._subTreeHeight(left[Z]) > self._subTreeHeight(right[Z]):
+        right[curr] = self._rightRotate(Z, left[Z])
+      return self._leftRotate(curr, right[curr])
+    return curr
+
+  def checkInvariants(self):
+    """check the tree to make sure it's valid"""
+    count = 0
+    stack = []
+    if self.root != NULL:
+      stack.append((self.root, None, None))
+    while len(stack) > 0:
+      curr, lo, hi = stack.pop()
+      count += 1
+      key = self.keys[curr]
+      if (lo != None and not lo < key) or (hi != None and not key < hi):
+        print("BST keys out of order!!!")
+        return False
+      LSH = self._subTreeHeight(self.left[curr])
+      RSH = self._subTreeHeight(self.right[curr])
+      if self.height[curr] != max(LSH, RSH) or abs(LSH - RSH) > 1:
+        print("AVL heights/balance incorrect!!!")
+        return False
+      if self.left[curr] != NULL:
+        stack.append((self.left[curr], lo, key))
+      if self.right[curr] != NULL:
+        stack.append((self.right[curr], key, hi))
+    if count != self.size:
+      print("BST size incorrect!!!")
+      return False
+    return True
+
+  def memoryUsage(self):
+    """bytes used by the pool's own arrays (not the keys/values)"""
+    return sys.getsizeof(self.keys) + sys.getsizeof(self.values) + \
+           sys.getsizeof(self.left) + sys.getsizeof(self.right) + \
+           sys.getsizeof(self.height) + sys.getsizeof(self.free)
+
+# ---------------------------------------------- #
+
+def nodeMemoryUsage(bst):
+  """bytes used by an AVLBST's node objects (not the keys/values)"""
+  total = 0
+  stack = []
+  if bst.root != None:
+    stack.append(bst.root)
+  while len(stack) > 0:
+    curr = stack.pop()
+    total += sys.getsizeof(curr)
+    if hasattr(curr, "__dict__"):
+      total += sys.getsizeof(curr.__dict__)
+    if curr.left != None:
+      stack.append(curr.left)
+    if curr.right != None:
+      stack.append(curr.right)
+  return total
+
+def memoryReport(n):
+  """print memory used by n-node AVLBST vs AVLBSTPool"""
+  from avlbst import AVLBST
+  items = [(i, i) for i in range(n)]
+  bst = AVLBST.fromSorted(items)
+  pool = AVLBSTPool()
+  for key, value in items:
+    pool.insert(key, value)
+  nodebytes = nodeMemoryUsage(bst)
+  poolbytes = pool.memoryUsage()
+  print("memory for %d nodes (keys/values not included):" % n)
+  print("  AVLBST nodes:  %12d bytes  (%5.1f per node)" % (nodebytes, nodebytes/n))
+  print("  AVLBSTPool:    %12d bytes  (%5.1f per node)" % (poolbytes, poolbytes/n))
+
+def main():
+  if len(sys.argv) > 1:
+    n = int(sys.argv[1])
+  else:
+    n = 100000
+  memoryReport(n)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,324 @@
+"""
+Latency histograms and size/height gauges for an AVLBST
+
+AVLBSTProfiler times every insert/remove/get/update (and the
+traversals) of one tree, and keeps a log-bucketed histogram of the
+latencies for each operation, so p50/p99/p999 can be read off at
+any time in O(buckets), no matter how many operations were timed.
+Every sampleEvery operations it also records the tree's size and
+height, with a timestamp.
+
+    profiler = AVLBSTProfiler(bst)
+    with profiler:                   # or profiler.attach()/detach()
+      ...use bst as usual...
+    profiler.writeJSON("avlbst.json")
+    profiler.writePrometheus("avlbst.prom")
+
+Attaching wraps the tree's methods in this one instance only (other
+trees, and this one after detach(), run the plain code). Only the
+outermost call is timed: a timed method that calls another (getItems()
+calling items(), say) counts as one operation. Extra hooks get called
+as hook(op, seconds) after each timed operation.
+"""
+
+from contextlib import contextmanager
+from time import perf_counter, time
+import json
+import math
+import os
+import threading
+
+# operations that return a value (keys/values/items return views:
+# only making the view is timed, iterate with getKeys() etc to time that)
+TIMED = ["insert", "remove", "get", "update", "contains",
+         "insertMany", "removeMany", "updateMany", "getMany",
+         "getKeys", "getItems", "traverseInOrder", "traversePreOrder",
+         "traversePostOrder", "traverseLevelOrder",
+         "keys", "values", "items"]
+# operations that return a generator: timed while generating
+TIMEDGENERATORS = ["irange", "irangeItems", "iterLevelOrder", "iterLevels"]
+
+class LatencyHistogram(object):
+  """log-bucketed histogram: bucket bounds grow by 2**(1/subBuckets)"""
+
+  def __init__(self, subBuckets=4, smallest=1e-7):
+    """histogram constructor: empty; values <= smallest share bucket 0"""
+    self.subBuckets = subBuckets
+    self.smallest = smallest
+    self.counts = {}          # bucket index -> count
+    self.count = 0
+    self.total = 0.0
+    self.min = None
+    self.max = None
+
+  def __repr__(self):
+    return "%s()" % (self.__class__.__name__)
+  def __str__(self):
+    return "Count: %d, p50: %g, p99: %g, p999: %g" % (self.count,
+      self.percentile(50), self.percentile(99), self.percentile(99.9))
+
+  def record(self, value):
+    """add one value (seconds)"""
+    i = self._bucket(value)
+    self.counts[i] = self.counts.get(i, 0) + 1
+    self.count += 1
+    self.total += value
+    if self.min is None or value < self.min:
+      self.min = value
+    if self.max is None or value > self.max:
+      self.max = value
+
+  def percentile(self, p):
+    """return value below which p percent of values fall (0 if empty)"""
+    # the top of the bucket holding it, so at most 2**(1/subBuckets)
+    # times too big (and never bigger than the largest value seen)
+    if self.count == 0:
+      return 0.0
+    rank = p / 100.0 * self.count
+    seen = 0
+    for i in sorted(self.counts):
+      seen += self.counts[i]
+      if seen >= rank:
+        return min(self.upperBound(i), self.max)
+    return self.max
+
+  def mean(self):
+    """return average value (0 if empty)"""
+    if self.count == 0:
+      return 0.0
+    return self.total / self.count
+
+  def upperBound(self, i):
+    """return largest value that goes in bucket i"""
+    return self.smallest * 2 ** (i / self.subBuckets)
+
+  def buckets(self):
+    """return list of (upper bound, count) pairs, smallest first"""
+    return [(self.upperBound(i), self.counts[i]) for i in sorted(self.counts)]
+
+  def summary(self):
+    """return dict of count/sum/min/max/mean/percentiles/buckets"""
+    return {"count": self.count, "sum": self.total, "min": self.min,
+            "max": self.max, "mean": self.mean(),
+            "p50": self.percentile(50), "p99": self.percentile(99),
+            "p999": self.percentile(99.9), "buckets": self.buckets()}
+
+  def _bucket(self, value):
+    """private helper function: index of the bucket for value"""
+    if value <= self.smallest:
+      return 0
+    return math.ceil(math.log2(value / self.smallest) * self.subBuckets)
+
+class AVLBSTProfiler(object):
+
+  def __init__(self, tree, sampleEvery=1000, subBuckets=4):
+    """profiler constructor: for tree, not attached yet"""
+    self.tree = tree
+    self.sampleEvery = sampleEvery
+    self.subBuckets = subBuckets
+    self.hooks = []
+    self.attached = False
+    # local.busy: this thread is inside a timed operation already
+    self._local = threading.local()
+    self.reset()
+
+  def __repr__(self):
+    return "%s(%r)" % (self.__class__.__name__, self.tree)
+  def __str__(self):
+    lines = []
+    for op in sorted(self.histograms):
+      lines.append("%-18s %s" % (op, self.histograms[op]))
+    return "\n".join(lines)
+
+  def reset(self):
+    """forget all latencies and samples"""
+    self.histograms = {}
+    self.samples = []           # (time, size, height)
+    self._ops = 0
+
+  def addHook(self, hook):
+    """call hook(op, seconds) after every timed operation"""
+    self.hooks.append(hook)
+
+  def removeHook(self, hook):
+    """stop calling hook"""
+    self.hooks.remove(hook)
+
+  def attach(self):
+    """start timing the tree's operations"""
+    if self.attached:
+      return
+    tree = self.tree
+    for op in TIMED:
+      setattr(tree, op, self._timed(op, getattr(tree, op)))
+    for op in TIMEDGENERATORS:
+      setattr(tree, op, self._timedGenerator(op, getattr(tree, op)))
+    self.attached = True
+    self.sample()
+
+  def detach(self):
+    """stop timing, go back to the tree's plain methods"""
+    if not self.attached:
+      return
+    for op in TIMED + TIMEDGENERATORS:
+      delattr(self.tree, op)
+    self.attached = False
+    self.sample()
+
+  def __enter__(self):
+    self.attach()
+    return self
+  def __exit__(self, *exc):
+    self.detach()
+
+  @contextmanager
+  def measure(self, op):
+    """context manager: time a block of code as operation op"""
+    start = perf_counter()
+    try:
+      yield
+    finally:
+      self.record(op, perf_counter() - start)
+
+  def record(self, op, seconds):
+    """add one latency for op, run hooks, sample gauges if it's time"""
+    histogram = self.histograms.get(op)
+    if histogram is None:
+      histogram = self.histograms[op] = LatencyHistogram(self.subBuckets)
+    histogram.record(seconds)
+    for hook in self.hooks:
+      hook(op, seconds)
+    self._ops += 1
+    if self._ops % self.sampleEvery == 0:
+      self.sample()
+
+  def sample(self):
+    """record tree's size and height now"""
+    root = self.tree.root
+    height = 0
+    if root is not None:
+      height = root.height + 1
+    self.samples.append((time(), self.tree.size, height))
+
+  def report(self):
+    """return dict of latency summaries (per op) and gauge samples"""
+    ops = {}
+    for op in self.histograms:
+      ops[op] = self.histograms[op].summary()
+    return {"operations": ops, "samples": self.samples}
+
+  def writeJSON(self, filename):
+    """write report() to filename as JSON"""
+    self._writeAtomic(filename, json.dumps(self.report(), indent=2) + "\n")
+
+  def writePrometheus(self, filename):
+    """write latencies and gauges to filename in Prometheus text format"""
+    lines = ["# HELP avlbst_op_latency_seconds AVLBST operation latency",
+             "# TYPE avlbst_op_latency_seconds histogram"]
+    for op in sorted(self.histograms):
+      histogram = self.histograms[op]
+      seen = 0
+      for bound, count in histogram.buckets():
+        seen += count
+        lines.append('avlbst_op_latency_seconds_bucket{op="%s",le="%.6g"} %d'
+                     % (op, bound, seen))
+      lines.append('avlbst_op_latency_seconds_bucket{op="%s",le="+Inf"} %d'
+                   % (op, histogram.count))
+      lines.append('avlbst_op_latency_seconds_sum{op="%s"} %.9g'
+                   % (op, histogram.total))
+      lines.append('avlbst_op_latency_seconds_count{op="%s"} %d'
+                   % (op, histogram.count))
+    lines += ["# HELP avlbst_op_latency_quantile_seconds latency percentiles",
+              "# TYPE avlbst_op_latency_quantile_seconds gauge"]
+    for op in sorted(self.histograms):
+      for q in [50, 99, 99.9]:
+        lines.append('avlbst_op_latency_quantile_seconds{op="%s",quantile="%g"} %.9g'
+                     % (op, q / 100.0, self.histograms[op].percentile(q)))
+    if len(self.samples) > 0:
+      when, size, height = self.samples[-1]
+      lines += ["# HELP avlbst_size number of keys in the tree",
+                "# TYPE avlbst_size gauge",
+                "avlbst_size %d" % size,
+                "# HELP avlbst_height height of the tree",
+                "# TYPE avlbst_height gauge",
+                "avlbst_height %d" % height]
+    self._writeAtomic(filename, "\n".join(lines) + "\n")
+
+  def _writeAtomic(self, filename, text):
+    """private helper function: write text so readers never see half of it"""
+    tmpname = filename + ".tmp"
+    with open(tmpname, "w") as ofl:
+      ofl.write(text)
+    os.replace(tmpname, filename)
+
+  def _timed(self, op, method):
+    """private helper function: wrap method so each call is timed"""
+    local = self._local
+    def timed(*args, **kwargs):
+      if getattr(local, "busy", False):
+        return method(*args, **kwargs)
+      local.busy = True
+      start = perf_counter()
+      try:
+        return method(*args, **kwargs)
+      finally:
+        elapsed = perf_counter() - start
+        local.busy = False
+        self.record(op, elapsed)
+    return timed
+
+  def _timedGenerator(self, op, method):
+    """private helper function: wrap generator method, time generating"""
+    local = self._local
+    def timed(*args, **kwargs):
+      if getattr(local, "busy", False):
+        return method(*args, **kwargs)
+      return self._generate(op, method(*args, **kwargs))
+    return timed
+
+  def _generate(self, op, it):
+    """private helper function: pass on the items of it, timing each next()"""
+    # only the time spent inside the generator counts, not the time
+    # the caller spends between items (which may be other operations,
+    # so we're only busy during next()); recorded when it's finished
+    local = self._local
+    elapsed = 0.0
+    try:
+      while True:
+        local.busy = True
+        start = perf_counter()
+        try:
+          item = next(it)
+        except StopIteration:
+          return
+        finally:
+          elapsed += perf_counter() - start
+          local.busy = False
+        yield item
+    finally:
+      self.record(op, elapsed)
+
+# ---------------------------------------------- #
+
+def main():
+  """some simple test code"""
+  from avlbst import AVLBST
+  from random import shuffle
+  keys = list(range(100000))
+  shuffle(keys)
+  bst = AVLBST()
+  profiler = AVLBSTProfiler(bst, sampleEvery=10000)
+  with profiler:
+    for key in keys:
+      bst.insert(key, key)
+    for key in keys:
+      bst.get(key)
+    for key in bst.irange():
+      pass
+    for key in keys[:50000]:
+      bst.remove(key)
+  print(profiler)
+  print(profiler.samples[-1])
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,67 @@
+"""
+Views of an AVLBST's keys, values and items
+
+AVLBST.keys()/values()/items() return these, like a dict does:
+they hold no copy of anything, just the tree, so len() is O(1),
+"in" is a search, and iterating streams the tree in key order
+(reversed() streams it largest key first). The keys and items
+views are also sets, so ==, &, |, -, ^ and <= work on them.
+"""
+
+from collections.abc import KeysView, ValuesView, ItemsView
+
+class AVLBSTKeysView(KeysView):
+
+  def __iter__(self):
+    """iterate over keys in order"""
+    for node in self._mapping._iterNodes():
+      yield node.key
+
+  def __reversed__(self):
+    """iterate over keys in reverse order"""
+    for node in self._mapping._iterNodes(True):
+      yield node.key
+
+class AVLBSTValuesView(ValuesView):
+
+  def __contains__(self, value):
+    """return True if some key has this value (O(n))"""
+    for v in self:
+      if v is value or v == value:
+        return True
+    return False
+
+  def __iter__(self):
+    """iterate over values in key order"""
+    for node in self._mapping._iterNodes():
+      yield node.value
+
+  def __reversed__(self):
+    """iterate over values, largest key first"""
+    for node in self._mapping._iterNodes(True):
+      yield node.value
+
+class AVLBSTItemsView(ItemsView):
+
+  def __iter__(self):
+    """iterate over (key,value) pairs in key order"""
+    return self._mapping._iterItems()
+
+  def __reversed__(self):
+    """iterate over (key,value) pairs, largest key first"""
+    return self._mapping._iterItems(True)
+
+# ---------------------------------------------- #
+
+def main():
+  """some simple test code"""
+  from avlbst import AVLBST
+  bst = AVLBST.fromSorted([(i, i*i) for i in range(10)])
+  keys = bst.keys()
+  print(len(keys), 3 in keys, list(reversed(keys)))
+  print(keys & {1, 5, 20}, keys == AVLBST.fromSorted(bst.items()).keys())
+  bst.insert(10, 100)
+  print(len(keys), list(bst.values()), (10, 100) in bst.items())
+
+if __name__ == "__main__":
+  main()
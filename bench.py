@@ -0,0 +1,420 @@
+"""
+AVLBST benchmarks
+
+    python3 bench.py [n]
+
+quick report: compares building a tree with repeated insert()
+calls against the bulk-load constructors, times the insert/get/remove
+engine, batch operations, saved and frozen trees
+
+    python3 bench.py --suite [--sizes 1000,100000] [--orders random,zipf]
+                     [--reads 0.9] [--json results.json] [--compare old.json]
+
+full suite: every operation, for each tree size and key order, on
+an AVLBST and on a dict+bisect baseline, with results written as JSON
+(and compared against an earlier run's JSON, to spot regressions)
+"""
+
+import argparse
+import avlbst
+import json
+import os
+import platform
+import sys
+import tempfile
+from bisect import bisect_left, insort
+from random import shuffle, Random
+from time import perf_counter, strftime
+
+def timeit(f):
+  """run f(), return (elapsed seconds, result)"""
+  start = perf_counter()
+  result = f()
+  return perf_counter() - start, result
+
+def buildByInsert(items):
+  """build tree one insert() at a time"""
+  bst = avlbst.AVLBST()
+  for key, value in items:
+    bst.insert(key, value)
+  return bst
+
+def benchBulkLoad(n):
+  """time insert() loop vs fromSorted()/fromIterable() for n keys"""
+  items = [(i, str(i)) for i in range(n)]
+  shuffled = items[:]
+  shuffle(shuffled)
+  tinsert, bst = timeit(lambda: buildByInsert(shuffled))
+  tsorted, bst = timeit(lambda: avlbst.AVLBST.fromSorted(items))
+  titer, bst = timeit(lambda: avlbst.AVLBST.fromIterable(shuffled))
+  print("bulk load, n = %d" % n)
+  print("  insert() loop:   %8.4f sec" % tinsert)
+  print("  fromSorted():    %8.4f sec  (%5.1fx)" % (tsorted, tinsert/tsorted))
+  print("  fromIterable():  %8.4f sec  (%5.1fx)" % (titer, tinsert/titer))
+
+def benchOps(n):
+  """time n inserts, gets and removes of random keys"""
+  keys = list(range(n))
+  shuffle(keys)
+  bst = avlbst.AVLBST()
+  def inserts():
+    for key in keys:
+      bst.insert(key, key)
+  def gets():
+    for key in keys:
+      bst.get(key)
+  def removes():
+    for key in keys:
+      bst.remove(key)
+  print("engine, n = %d" % n)
+  print("  insert():        %8.4f sec" % timeit(inserts)[0])
+  print("  get():           %8.4f sec" % timeit(gets)[0])
+  print("  checkInvariants: %8.4f sec" % timeit(bst.checkInvariants)[0])
+  print("  remove():        %8.4f sec" % timeit(removes)[0])
+
+def benchUnion(n):
+  """time merging an n/10-key tree into an n-key tree"""
+  big = [(i, i) for i in range(0, 2*n, 2)]
+  small = [(i, i) for i in range(1, 2*n, 20)]
+  def insertLoop():
+    bst = avlbst.AVLBST.fromSorted(big)
+    for key, value in small:
+      bst.insert(key, value)
+  def union():
+    A = avlbst.AVLBST.fromSorted(big)
+    A.union(avlbst.AVLBST.fromSorted(small))
+  def build():
+    avlbst.AVLBST.fromSorted(big)
+    avlbst.AVLBST.fromSorted(small)
+  tbuild = timeit(build)[0]
+  print("merge %d keys into %d (tree building not included)" % (len(small), n))
+  print("  insert() loop:   %8.4f sec" % (timeit(insertLoop)[0] - tbuild))
+  print("  union():         %8.4f sec" % (timeit(union)[0] - tbuild))
+
+def benchBatches(n):
+  """time batch operations vs per-key loops at several batch/tree ratios"""
+  print("batches into a tree of %d keys" % n)
+  for ratio in [0.01, 0.1, 1.0]:
+    m = max(int(n * ratio), 1)
+    items = [(i, i) for i in range(0, 2*n, 2)]
+    batch = [(i, i) for i in range(1, 2*m*2, 2)][:m]
+    shuffle(batch)
+    keys = [key for key, value in batch]
+    def build():
+      return avlbst.AVLBST.fromSorted(items)
+    tbuild = timeit(build)[0]
+    def insertLoop():
+      bst = build()
+      for key, value in batch:
+        bst.insert(key, value)
+      return bst
+    def insertMany():
+      bst = build()
+      bst.insertMany(batch)
+      return bst
+    tloop, bst = timeit(insertLoop)
+    tmany = timeit(insertMany)[0]
+    tgetloop = timeit(lambda: [bst.get(key) for key in keys])[0]
+    tgetmany = timeit(lambda: bst.getMany(keys))[0]
+    tremloop = timeit(lambda: [bst.remove(key) for key in keys])[0]
+    bst.insertMany(batch)
+    tremmany = timeit(lambda: bst.removeMany(keys))[0]
+    print("  batch of %d (%g x tree)" % (m, ratio))
+    print("    insert() loop %8.4f   insertMany() %8.4f sec" % \
+          (tloop - tbuild, tmany - tbuild))
+    print("    get() loop    %8.4f   getMany()    %8.4f sec" % \
+          (tgetloop, tgetmany))
+    print("    remove() loop %8.4f   removeMany() %8.4f sec" % \
+          (tremloop, tremmany))
+
+def benchMapped(n):
+  """time reopening a saved tree vs rebuilding it"""
+  import os, tempfile
+  fn = os.path.join(tempfile.mkdtemp(), "bench.avl")
+  items = [(i, i) for i in range(n)]
+  bst = avlbst.AVLBST.fromSorted(items)
+  tsave = timeit(lambda: bst.save(fn))[0]
+  topen, mapped = timeit(lambda: avlbst.AVLBST.openMapped(fn))
+  tload = timeit(lambda: avlbst.AVLBST.load(fn))[0]
+  keys = list(range(0, n, max(n // 10000, 1)))
+  tget = timeit(lambda: [mapped.get(key) for key in keys])[0]
+  mapped.close()
+  os.remove(fn)
+  print("saved tree, n = %d" % n)
+  print("  save():          %8.4f sec" % tsave)
+  print("  openMapped():    %8.4f sec" % topen)
+  print("  load():          %8.4f sec" % tload)
+  print("  %d mapped gets: %8.4f sec" % (len(keys), tget))
+
+def benchFrozen(n):
+  """time batch lookups on a frozen tree vs get() on the pointer tree"""
+  try:
+    import numpy
+  except ImportError:
+    print("frozen tree: skipped, needs numpy")
+    return
+  items = [(i, i) for i in range(0, 2*n, 2)]
+  bst = avlbst.AVLBST.fromSorted(items)
+  tfreeze, frozen = timeit(bst.freeze)
+  keys = numpy.random.randint(0, 2*n, size=n)
+  klist = keys.tolist()
+  tget = timeit(lambda: [bst.get(key) for key in klist])[0]
+  tmany = timeit(lambda: bst.getMany(klist))[0]
+  tfrozen = timeit(lambda: frozen.getMany(keys))[0]
+  print("frozen tree, n = %d, %d lookups (half misses)" % (n, n))
+  print("  freeze():        %8.4f sec" % tfreeze)
+  print("  get() loop:      %8.4f sec" % tget)
+  print("  getMany():       %8.4f sec" % tmany)
+  print("  frozen getMany():%8.4f sec  (%5.1fx)" % (tfrozen, tget/tfrozen))
+
+# ---------------------------------------------- #
+# full suite
+
+ORDERS = ["sequential", "random", "zipf", "adversarial"]
+
+class DictBisect(object):
+  """baseline: dict for values plus a sorted list of keys (bisect)"""
+
+  def __init__(self):
+    self.values = {}
+    self.sortedkeys = []
+
+  def insert(self, key, value):
+    if key not in self.values:
+      insort(self.sortedkeys, key)
+    self.values[key] = value
+
+  def remove(self, key):
+    del self.values[key]
+    del self.sortedkeys[bisect_left(self.sortedkeys, key)]
+
+  def get(self, key):
+    return self.values[key]
+
+  def update(self, key, value):
+    self.values[key] = value
+
+  def contains(self, key):
+    return key in self.values
+
+  def findMin(self):
+    return self.sortedkeys[0]
+
+  def findMax(self):
+    return self.sortedkeys[-1]
+
+  def items(self):
+    values = self.values
+    for key in self.sortedkeys:
+      yield (key, values[key])
+
+def zigzag(keys):
+  """keys (sorted) from both ends in turn: smallest, largest, 2nd smallest..."""
+  result = []
+  lo = 0
+  hi = len(keys) - 1
+  while lo <= hi:
+    result.append(keys[lo])
+    if lo < hi:
+      result.append(keys[hi])
+    lo += 1
+    hi -= 1
+  return result
+
+def workload(n, order, m, rng):
+  """return (insert order, m lookup keys) for n keys in given order"""
+  # keys are the even numbers 0..2n-2, so odd numbers are never in the tree
+  keys = list(range(0, 2*n, 2))
+  if order == "sequential":
+    inserts = keys
+    lookups = [keys[i % n] for i in range(m)]
+  elif order == "random":
+    inserts = keys[:]
+    rng.shuffle(inserts)
+    lookups = [rng.choice(keys) for i in range(m)]
+  elif order == "zipf":
+    # random insert order; lookups skewed: i-th hottest key has weight 1/i
+    inserts = keys[:]
+    rng.shuffle(inserts)
+    hot = keys[:]
+    rng.shuffle(hot)
+    cumulative = []
+    total = 0.0
+    for i in range(1, n+1):
+      total += 1.0 / i
+      cumulative.append(total)
+    lookups = rng.choices(hot, cum_weights=cumulative, k=m)
+  elif order == "adversarial":
+    # from both ends towards the middle: every insert lands on the
+    # deep inner edge of the tree and keeps it rebalancing; lookups
+    # alternate between the two extremes, which are leaves
+    inserts = zigzag(keys)
+    lookups = [inserts[i % n] for i in range(m)]
+  else:
+    raise ValueError("unknown key order: %s" % order)
+  return inserts, lookups
+
+def timeOps(results, size, order, structure, ops):
+  """run (name, count, f) ops, add one result dict per op to results"""
+  for name, count, f in ops:
+    seconds = timeit(f)[0]
+    results.append({"size": size, "order": order, "structure": structure,
+                    "op": name, "count": count, "seconds": seconds,
+                    "opsPerSec": count / seconds if seconds > 0 else None})
+    print("  %-10s %-12s %-12s %-16s %10.4f sec" % (size, order, structure,
+                                                    name, seconds))
+
+def suiteOps(tree, inserts, lookups, reads, dotMax):
+  """list of (name, count, f) benchmarks for an AVLBST or DictBisect"""
+  n = len(inserts)
+  m = len(lookups)
+  misses = [key + 1 for key in lookups]
+  # mixed: reads of lookups, spread evenly; writes alternately insert
+  # a new (odd) key and remove it again, so the size stays about n
+  mixed = []
+  writes = 0
+  for i in range(m):
+    if int((i+1) * reads) > int(i * reads):
+      mixed.append((0, lookups[i]))
+    else:
+      mixed.append((1 + writes % 2, 2 * (writes // 2) + 1))
+      writes += 1
+  def insert():
+    for key in inserts:
+      tree.insert(key, key)
+  def get():
+    for key in lookups:
+      tree.get(key)
+  def contains():
+    for key in misses:
+      tree.contains(key)
+  def update():
+    for key in lookups:
+      tree.update(key, -key)
+  def minmax():
+    for i in range(m):
+      tree.findMin()
+      tree.findMax()
+  def traverse():
+    for item in tree.items():
+      pass
+  def mix():
+    for kind, key in mixed:
+      if kind == 0:
+        tree.get(key)
+      elif kind == 1:
+        tree.insert(key, key)
+      else:
+        tree.remove(key)
+  def remove():
+    for key in inserts:
+      tree.remove(key)
+  ops = [("insert", n, insert), ("get", m, get), ("contains(miss)", m, contains),
+         ("update", m, update), ("findMin/Max", 2*m, minmax),
+         ("traverse", n, traverse), ("mixed", m, mix)]
+  if isinstance(tree, avlbst.AVLBST):
+    ops.append(("checkInvariants", n, tree.checkInvariants))
+    if n <= dotMax:
+      def dot():
+        fn = os.path.join(tempfile.mkdtemp(), "bench.dot")
+        tree.writeDotFile(fn)
+        os.remove(fn)
+        os.rmdir(os.path.dirname(fn))
+      ops.append(("writeDotFile", n, dot))
+  ops.append(("remove", n, remove))
+  return ops
+
+def runSuite(sizes, orders, reads, ops=None, seed=0, baseline=True,
+             dotMax=100000):
+  """run full suite, return dict with run info and list of results"""
+  results = []
+  for size in sizes:
+    for order in orders:
+      m = ops or size
+      inserts, lookups = workload(size, order, m, Random(seed))
+      structures = [("avlbst", avlbst.AVLBST())]
+      if baseline:
+        structures.append(("dict+bisect", DictBisect()))
+      for name, tree in structures:
+        timeOps(results, size, order, name,
+                suiteOps(tree, inserts, lookups, reads, dotMax))
+  info = {"date": strftime("%Y-%m-%d %H:%M:%S"),
+          "python": platform.python_version(),
+          "implementation": platform.python_implementation(),
+          "machine": platform.machine(), "sizes": sizes, "orders": orders,
+          "reads": reads, "ops": ops, "seed": seed}
+  return {"info": info, "results": results}
+
+def compareResults(old, new):
+  """print new/old time ratio for each result in both runs"""
+  def byKey(run):
+    return dict(((r["size"], r["order"], r["structure"], r["op"]), r)
+                for r in run["results"])
+  before = byKey(old)
+  after = byKey(new)
+  print("compared with %s run (ratio > 1: slower now)" % old["info"]["date"])
+  for key in sorted(after, key=str):
+    if key in before and before[key]["seconds"] > 0:
+      ratio = after[key]["seconds"] / before[key]["seconds"]
+      flag = ""
+      if ratio > 1.1:
+        flag = "  <-- slower"
+      print("  %-10s %-12s %-12s %-16s %6.2f%s" % (key + (ratio, flag)))
+
+def parseList(text, convert=str):
+  """"a,b,c" -> list; numbers may use k/M suffixes (10k, 1M)"""
+  items = []
+  for item in text.split(","):
+    if convert is int:
+      scale = {"k": 1000, "M": 1000000}.get(item[-1], 1)
+      if scale > 1:
+        item = item[:-1]
+      items.append(int(item) * scale)
+    else:
+      items.append(item)
+  return items
+
+def main():
+  parser = argparse.ArgumentParser(description="AVLBST benchmarks")
+  parser.add_argument("n", nargs="?", type=int, default=100000,
+                      help="tree size for the quick report")
+  parser.add_argument("--suite", action="store_true",
+                      help="run the full suite instead of the quick report")
+  parser.add_argument("--sizes", default="1k,10k,100k",
+                      help="tree sizes, e.g. 1k,10k,100k,1M,10M")
+  parser.add_argument("--orders", default=",".join(ORDERS),
+                      help="key orders: " + ", ".join(ORDERS))
+  parser.add_argument("--reads", type=float, default=0.9,
+                      help="fraction of reads in the mixed workload")
+  parser.add_argument("--ops", type=int, default=None,
+                      help="lookups per benchmark (default: tree size)")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--no-baseline", action="store_true",
+                      help="skip the dict+bisect baseline")
+  parser.add_argument("--dot-max", type=int, default=100000,
+                      help="largest tree to time writeDotFile on")
+  parser.add_argument("--json", help="write results to this file")
+  parser.add_argument("--compare", help="compare with results in this file")
+  args = parser.parse_args()
+  if not args.suite:
+    n = args.n
+    benchBulkLoad(n)
+    benchOps(n)
+    benchUnion(n)
+    benchBatches(n)
+    benchMapped(n)
+    benchFrozen(n)
+    return
+  run = runSuite(parseList(args.sizes, int), parseList(args.orders),
+                 args.reads, args.ops, args.seed, not args.no_baseline,
+                 args.dot_max)
+  if args.json:
+    with open(args.json, "w") as ofl:
+      json.dump(run, ofl, indent=1)
+      ofl.write("\n")
+  if args.compare:
+    with open(args.compare) as ifl:
+      compareResults(json.load(ifl), run)
+
+if __name__ == "__main__":
+  main()
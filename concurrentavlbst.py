@@ -0,0 +1,275 @@
+"""
+Thread-safe wrapper around AVLBST
+
+AVLBST itself has no locking: insert/remove rotate nodes and
+change the root part way through, so a reader running at the
+same time can see a broken tree. ConcurrentAVLBST guards the
+tree with a readers-writer lock (any number of readers, or one
+writer), can combine queued inserts into one batched insertMany()
+call, and keeps wait/hold time statistics for both kinds of lock.
+
+Readers never block each other. (With the GIL they still take
+turns running python code, but they don't wait on a global lock
+behind a writer that isn't there.)
+"""
+
+from avlbst import AVLBST
+from contextlib import contextmanager
+from time import perf_counter
+import threading
+
+class RWLock(object):
+  """readers-writer lock, writers first (so they can't be starved)"""
+
+  def __init__(self):
+    """rwlock constructor: unlocked, with zeroed statistics"""
+    self._cond = threading.Condition(threading.Lock())
+    self._readers = 0
+    self._writer = False
+    self._waitingWriters = 0
+    self._local = threading.local()
+    self.resetStats()
+
+  def acquireRead(self):
+    """block until no writer holds or is waiting for the lock"""
+    # not reentrant: a thread holding the read lock must not ask again
+    start = perf_counter()
+    with self._cond:
+      while self._writer or self._waitingWriters > 0:
+        self._cond.wait()
+      self._readers += 1
+      now = perf_counter()
+      self._recordWait("read", now - start)
+    self._local.readStart = now
+
+  def releaseRead(self):
+    """give up read lock"""
+    held = perf_counter() - self._local.readStart
+    with self._cond:
+      self._readers -= 1
+      self._recordHold("read", held)
+      if self._readers == 0:
+        self._cond.notify_all()
+
+  def acquireWrite(self):
+    """block until no one else holds the lock"""
+    start = perf_counter()
+    with self._cond:
+      self._waitingWriters += 1
+      while self._writer or self._readers > 0:
+        self._cond.wait()
+      self._waitingWriters -= 1
+      self._writer = True
+      now = perf_counter()
+      self._recordWait("write", now - start)
+    self._local.writeStart = now
+
+  def releaseWrite(self):
+    """give up write lock"""
+    held = perf_counter() - self._local.writeStart
+    with self._cond:
+      self._writer = False
+      self._recordHold("write", held)
+      self._cond.notify_all()
+
+  @contextmanager
+  def readLocked(self):
+    """context manager: with lock.readLocked(): ..."""
+    self.acquireRead()
+    try:
+      yield
+    finally:
+      self.releaseRead()
+
+  @contextmanager
+  def writeLocked(self):
+    """context manager: with lock.writeLocked(): ..."""
+    self.acquireWrite()
+    try:
+      yield
+    finally:
+      self.releaseWrite()
+
+  def stats(self):
+    """return dict of read/write lock statistics (times in seconds)"""
+    with self._cond:
+      return {"read": dict(self._stats["read"]),
+              "write": dict(self._stats["write"])}
+
+  def resetStats(self):
+    """zero all statistics"""
+    self._stats = {}
+    for mode in ["read", "write"]:
+      self._stats[mode] = {"acquired": 0, "waitTime": 0.0, "maxWait": 0.0,
+                           "holdTime": 0.0, "maxHold": 0.0}
+
+  def _recordWait(self, mode, wait):
+    """private helper function: add one lock wait (cond lock held)"""
+    stats = self._stats[mode]
+    stats["acquired"] += 1
+    stats["waitTime"] += wait
+    if wait > stats["maxWait"]:
+      stats["maxWait"] = wait
+
+  def _recordHold(self, mode, held):
+    """private helper function: add one lock hold (cond lock held)"""
+    stats = self._stats[mode]
+    stats["holdTime"] += held
+    if held > stats["maxHold"]:
+      stats["maxHold"] = held
+
+class ConcurrentAVLBST(object):
+
+  def __init__(self, tree=None, batchSize=1000):
+    """wrap tree (or a new AVLBST); queued inserts flush every batchSize"""
+    if tree is None:
+      tree = AVLBST()
+    self.tree = tree
+    self.batchSize = batchSize
+    self.lock = RWLock()
+    self._pending = []                   # queued (key,value) inserts
+    self._pendingLock = threading.Lock()
+    self._batches = 0
+    self._batchedInserts = 0
+
+  def __repr__(self):
+    return "%s(%r)" % (self.__class__.__name__, self.tree)
+  def __str__(self):
+    return "Size: %d, Pending: %d" % (len(self.tree), len(self._pending))
+
+  # readers: any number at once. queued inserts are applied first,
+  # so a thread always sees its own writes.
+
+  def get(self, key):
+    """find node with key, return it's value"""
+    self._flushIfPending()
+    with self.lock.readLocked():
+      return self.tree.get(key)
+
+  def contains(self, key):
+    """return True if key in tree, False if not"""
+    self._flushIfPending()
+    with self.lock.readLocked():
+      return self.tree.contains(key)
+
+  def getMany(self, keys, default=None):
+    """return list of values for batch of keys (default if not found)"""
+    self._flushIfPending()
+    with self.lock.readLocked():
+      return self.tree.getMany(keys, default)
+
+  def getSize(self):
+    """return size of tree"""
+    self._flushIfPending()
+    with self.lock.readLocked():
+      return len(self.tree)
+  def __len__(self):
+    """return size of tree"""
+    return self.getSize()
+
+  def snapshot(self):
+    """return read-only snapshot, safe to iterate without any locking"""
+    # taking a snapshot changes the tree's owner token, so it's a write
+    self._flushIfPending()
+    with self.lock.writeLocked():
+      return self.tree.snapshot()
+
+  # writers: one at a time, with no readers
+
+  def insert(self, key, value):
+    """add a new node (key-value pair) to the tree"""
+    self._flushIfPending()
+    with self.lock.writeLocked():
+      return self.tree.insert(key, value)
+
+  def remove(self, key):
+    """look for key in tree, remove node if found"""
+    self._flushIfPending()
+    with self.lock.writeLocked():
+      return self.tree.remove(key)
+
+  def update(self, key, value):
+    """find node with key, update it's value"""
+    self._flushIfPending()
+    with self.lock.writeLocked():
+      return self.tree.update(key, value)
+
+  def insertMany(self, items):
+    """insert batch of (key,value) pairs, return list of True/False (inserted)"""
+    self._flushIfPending()
+    with self.lock.writeLocked():
+      return self.tree.insertMany(items)
+
+  def removeMany(self, keys):
+    """remove batch of keys, return list of True/False (removed)"""
+    self._flushIfPending()
+    with self.lock.writeLocked():
+      return self.tree.removeMany(keys)
+
+  # write combining
+
+  def queueInsert(self, key, value):
+    """queue an insert; queued inserts are applied together as one batch"""
+    with self._pendingLock:
+      self._pending.append((key, value))
+      full = len(self._pending) >= self.batchSize
+    if full:
+      self.flush()
+
+  def flush(self):
+    """apply all queued inserts now, with one insertMany() call"""
+    # take the queue only once we hold the write lock: a reader that
+    # finds the queue empty must then wait for the batch to be applied
+    with self.lock.writeLocked():
+      with self._pendingLock:
+        batch = self._pending
+        self._pending = []
+      if len(batch) > 0:
+        self.tree.insertMany(batch)
+        self._batches += 1
+        self._batchedInserts += len(batch)
+
+  def _flushIfPending(self):
+    """private helper function: flush if anything is queued"""
+    if len(self._pending) > 0:
+      self.flush()
+
+  def stats(self):
+    """return dict of lock contention and batching statistics"""
+    stats = self.lock.stats()
+    stats["batches"] = self._batches
+    stats["batchedInserts"] = self._batchedInserts
+    stats["pending"] = len(self._pending)
+    return stats
+
+  def resetStats(self):
+    """zero all statistics"""
+    self.lock.resetStats()
+    self._batches = 0
+    self._batchedInserts = 0
+
+# ---------------------------------------------- #
+
+def main():
+  """some simple test code"""
+  from random import randrange
+  ctree = ConcurrentAVLBST(batchSize=100)
+  def writer(start):
+    for i in range(start, start + 2000):
+      ctree.queueInsert(i, i)
+  def reader():
+    for i in range(2000):
+      ctree.contains(randrange(8000))
+  threads = [threading.Thread(target=writer, args=(i*2000,)) for i in range(4)]
+  threads += [threading.Thread(target=reader) for i in range(4)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  ctree.flush()
+  assert(len(ctree) == 8000)
+  assert(ctree.tree.checkInvariants() == True)
+  print(ctree.stats())
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,115 @@
+"""
+Frozen (read-only) AVLBST for numeric keys, searched with NumPy
+
+FrozenAVLBST keeps its keys in one contiguous NumPy array in
+Eytzinger (BFS) order: position 1 holds the root, and the children
+of position k are at 2k and 2k+1. That's the order
+traverseLevelOrder() gives for a perfect tree, and it keeps the top
+levels of every search in the same few cache lines. getMany() walks
+a whole array of query keys down the implicit tree together, one
+vectorised step per level, with no per-key python code at all.
+
+needs numpy (AVLBST itself doesn't): use AVLBST.freeze()
+"""
+
+import numpy as np
+
+class FrozenAVLBST(object):
+
+  def __init__(self, items):
+    """build from (key,value) pairs sorted by key; keys must be numbers"""
+    items = list(items)
+    n = len(items)
+    keys = np.array([item[0] for item in items])
+    if n > 0 and keys.dtype.kind not in "iuf":
+      raise ValueError("FrozenAVLBST keys must be ints or floats")
+    self.size = n
+    self.depth = n.bit_length()      # levels in the implicit tree
+    # position 0 is unused, so the children of k are 2k and 2k+1
+    values = np.empty(n, dtype=object)
+    for i in range(n):
+      values[i] = items[i][1]
+    order = np.array(self._inOrderPositions(n)[1:], dtype=np.int64)
+    self._keys = np.zeros(n + 1, dtype=keys.dtype)
+    self._keys[1:] = keys[order]
+    self._values = np.empty(n + 1, dtype=object)
+    self._values[1:] = values[order]
+
+  def _inOrderPositions(self, n):
+    """private helper function: sorted index for each Eytzinger position"""
+    # an in-order walk of the implicit tree visits positions in key order
+    positions = [0] * (n + 1)
+    i = 0
+    stack = []
+    k = 1
+    while len(stack) > 0 or k <= n:
+      while k <= n:
+        stack.append(k)
+        k = 2 * k
+      k = stack.pop()
+      positions[k] = i
+      i += 1
+      k = 2 * k + 1
+    return positions
+
+  def __repr__(self):
+    return "%s()" % (self.__class__.__name__)
+  def __str__(self):
+    return "Size: %d, Depth: %d" % (self.size, self.depth)
+
+  def getSize(self):
+    """return number of keys"""
+    return self.size
+  def __len__(self):
+    """return number of keys"""
+    return self.size
+
+  def get(self, key, default=None):
+    """return value for key, or default if key not found"""
+    keys = self._keys
+    k = 1
+    while k <= self.size:
+      ckey = keys[k]
+      if key < ckey:
+        k = 2 * k
+      elif key > ckey:
+        k = 2 * k + 1
+      else:
+        return self._values[k]
+    return default
+
+  def contains(self, key):
+    """return True if key in tree, False if not"""
+    return self.get(key, self) is not self
+  def __contains__(self, key):
+    """return True if key in tree, False if not"""
+    return self.contains(key)
+
+  def getMany(self, keys, default=None):
+    """return list of values for an array of keys (default if not found)"""
+    found, positions = self._search(keys)
+    results = np.full(len(positions), default, dtype=object)
+    results[found] = self._values[positions[found]]
+    return results.tolist()
+
+  def containsMany(self, keys):
+    """return boolean numpy array: which keys are in the tree"""
+    return self._search(keys)[0]
+
+  def _search(self, keys):
+    """private helper function: (found mask, positions) for array of keys"""
+    # every query moves down one level per step. k is where each query
+    # is now; lower is the last position whose key was >= the query,
+    # i.e. where the query would be inserted. np.where instead of ifs
+    query = np.asarray(keys)
+    n = self.size
+    k = np.ones(query.shape, dtype=np.int64)
+    lower = np.zeros(query.shape, dtype=np.int64)
+    for level in range(self.depth):
+      inside = k <= n
+      ckeys = self._keys[np.where(inside, k, 0)]
+      right = ckeys < query
+      lower = np.where(inside & ~right, k, lower)
+      k = np.where(inside, 2 * k + right, k)
+    found = (lower > 0) & (self._keys[lower] == query)
+    return found, lower
@@ -0,0 +1,149 @@
+"""
+AVLBST that counts what its algorithms do
+
+InstrumentedAVLBST is an AVLBST whose searches, rotations and
+retracing also count key comparisons, nodes visited, path lengths,
+rotations by type and how far each retrace goes up the tree.
+
+Turn it on for an existing tree with tree.instrument() (and off
+with tree.instrument(False)): that just changes the tree's class,
+so a tree that isn't instrumented runs the plain AVLBST code, with
+no counters and no "if instrumented" tests anywhere.
+"""
+
+from avlbst import AVLBST
+
+class InstrumentedAVLBST(AVLBST):
+
+  def __init__(self, persistent=False, aggregate=None):
+    """instrumentedavlbst constructor: empty tree with zeroed counters"""
+    AVLBST.__init__(self, persistent, aggregate)
+    self.resetStats()
+
+  def resetStats(self):
+    """zero all counters"""
+    self._stats = {"searches": 0, "comparisons": 0, "nodesVisited": 0,
+                   "maxPathLength": 0, "retraces": 0, "retraceSteps": 0,
+                   "maxRetrace": 0, "rebalanceChecks": 0,
+                   "rotations": {"left": 0, "right": 0,
+                                 "rightLeft": 0, "leftRight": 0}}
+
+  def stats(self):
+    """return dict of counters (plus per-search/per-retrace averages)"""
+    stats = dict(self._stats)
+    stats["rotations"] = dict(stats["rotations"])
+    stats["avgPathLength"] = stats["nodesVisited"] / max(stats["searches"], 1)
+    stats["avgRetrace"] = stats["retraceSteps"] / max(stats["retraces"], 1)
+    return stats
+
+  def _record(self, visited, comparisons):
+    """private helper function: add one search to the counters"""
+    stats = self._stats
+    stats["searches"] += 1
+    stats["comparisons"] += comparisons
+    stats["nodesVisited"] += visited
+    if visited > stats["maxPathLength"]:
+      stats["maxPathLength"] = visited
+
+  # same loops as AVLBST's, counting as they go
+
+  def _findPath(self, key):
+    """private helper function: return (path, node) for key"""
+    path = []
+    comparisons = 0
+    curr = self.root
+    while curr is not None:
+      ckey = curr.key
+      comparisons += 1
+      if key < ckey:
+        path.append(curr)
+        curr = curr.left
+        continue
+      comparisons += 1
+      if key > ckey:
+        path.append(curr)
+        curr = curr.right
+      else:
+        self._record(len(path) + 1, comparisons)
+        return path, curr
+    self._record(len(path), comparisons)
+    return path, None
+
+  def _find(self, curr, key):
+    """private helper function to find node with key"""
+    visited = 0
+    comparisons = 0
+    while curr is not None:
+      ckey = curr.key
+      visited += 1
+      comparisons += 1
+      if key < ckey:
+        curr = curr.left
+        continue
+      comparisons += 1
+      if key > ckey:
+        curr = curr.right
+      else:
+        break
+    self._record(visited, comparisons)
+    return curr
+
+  def _retrace(self, path):
+    """private helper function: fix heights/balance from bottom of path up"""
+    stats = self._stats
+    before = stats["rebalanceChecks"]
+    AVLBST._retrace(self, path)
+    # _retrace checks balance once for each node it goes up to
+    steps = stats["rebalanceChecks"] - before
+    stats["retraces"] += 1
+    stats["retraceSteps"] += steps
+    if steps > stats["maxRetrace"]:
+      stats["maxRetrace"] = steps
+
+  def _rebalance(self, curr):
+    """given a node in the tree, check if we need to rebalance"""
+    self._stats["rebalanceChecks"] += 1
+    return AVLBST._rebalance(self, curr)
+
+  def _leftRotate(self, X, Z):
+    """left-rotate, so Z becomes root, X becomes left-child of Z"""
+    self._stats["rotations"]["left"] += 1
+    return AVLBST._leftRotate(self, X, Z)
+
+  def _rightRotate(self, X, Z):
+    """right-rotate, so Z becomes root, X becomes right-child of Z"""
+    self._stats["rotations"]["right"] += 1
+    return AVLBST._rightRotate(self, X, Z)
+
+  def _rightLeftRotate(self, X, Z):
+    """double rotate: first right, then left"""
+    self._stats["rotations"]["rightLeft"] += 1
+    return AVLBST._rightLeftRotate(self, X, Z)
+
+  def _leftRightRotate(self, X, Z):
+    """double rotate: first left, then right"""
+    self._stats["rotations"]["leftRight"] += 1
+    return AVLBST._leftRightRotate(self, X, Z)
+
+# ---------------------------------------------- #
+
+def main():
+  """some simple test code"""
+  from random import shuffle
+  keys = list(range(10000))
+  bst = InstrumentedAVLBST()
+  for key in keys:
+    bst.insert(key, key)
+  print("sorted inserts:  ", bst.stats())
+  bst.resetStats()
+  shuffle(keys)
+  for key in keys:
+    bst.get(key)
+  print("random gets:     ", bst.stats())
+  bst.resetStats()
+  for key in keys:
+    bst.remove(key)
+  print("random removes:  ", bst.stats())
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,275 @@
+"""
+Read-only AVLBST file format, used straight from a memory map
+
+writeMapped() stores a tree's items, sorted by key, in one file:
+
+    header     magic, key kind, byte order, count, section offsets
+    keys       int or float keys: one packed array of 8-byte numbers
+               other keys: pickled one by one, plus an offset index
+    values     pickled one by one, plus an offset index
+
+MappedAVLBST opens such a file with mmap and answers lookups by
+binary search over the sorted keys, decoding only the keys it
+probes and the values it returns, so opening a file is O(1) no
+matter how big it is. Numeric keys are searched in C (bisect on a
+memoryview of the mapped key array), with no decoding at all.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+import mmap
+import os
+import pickle
+import struct
+import sys
+
+MAGIC = b"AVLBST01"
+# magic, key kind, byte order, count, keys, key index, values, value index
+HEADER = struct.Struct("<8scc6xQQQQQ")
+
+def writeMapped(items, path):
+  """write sorted (key,value) pairs to path in the mapped format"""
+  items = list(items)
+  keys = [item[0] for item in items]
+  kind = _keyKind(keys)
+  tmppath = path + ".tmp"
+  with open(tmppath, "wb") as ofl:
+    ofl.write(b"\0" * HEADER.size)
+    _align(ofl)
+    keysOffset = ofl.tell()
+    keyIndexOffset = 0
+    if kind == b"p":
+      keyIndexOffset = _writeBlobs(ofl, keys)
+    else:
+      ofl.write(array(kind.decode(), keys).tobytes())
+    _align(ofl)
+    valuesOffset = ofl.tell()
+    valueIndexOffset = _writeBlobs(ofl, [item[1] for item in items])
+    ofl.seek(0)
+    ofl.write(HEADER.pack(MAGIC, kind, _byteOrder(), len(items), keysOffset,
+                          keyIndexOffset, valuesOffset, valueIndexOffset))
+  # readers of path never see a half-written file
+  os.replace(tmppath, path)
+
+def _keyKind(keys):
+  """private helper function: b"q" (int64), b"d" (float) or b"p" (pickle)"""
+  if len(keys) > 0 and all(type(key) is int for key in keys) and \
+     -2**63 <= keys[0] and keys[-1] < 2**63:
+    return b"q"
+  if len(keys) > 0 and all(type(key) is float for key in keys):
+    return b"d"
+  return b"p"
+
+def _byteOrder():
+  """private helper function: b"<" or b">" for this machine"""
+  if sys.byteorder == "little":
+    return b"<"
+  return b">"
+
+def _align(ofl):
+  """private helper function: pad file to a multiple of 8 bytes"""
+  ofl.write(b"\0" * (-ofl.tell() % 8))
+
+def _writeBlobs(ofl, objs):
+  """private helper function: write pickled objs, then their index"""
+  # index[i] is where obj i starts, relative to the first one;
+  # index[n] is where the last one ends. returns index offset
+  start = ofl.tell()
+  index = array("Q", [0])
+  for obj in objs:
+    ofl.write(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+    index.append(ofl.tell() - start)
+  _align(ofl)
+  indexOffset = ofl.tell()
+  ofl.write(index.tobytes())
+  return indexOffset
+
+class _PickledKeys(object):
+  """sequence view decoding pickled keys on demand (for bisect)"""
+
+  def __init__(self, buf, start, index):
+    self.buf = buf
+    self.start = start
+    self.index = index
+
+  def __len__(self):
+    return len(self.index) - 1
+
+  def __getitem__(self, i):
+    start = self.start
+    return pickle.loads(self.buf[start + self.index[i]:start + self.index[i+1]])
+
+class MappedAVLBST(object):
+
+  def __init__(self, path):
+    """open file written by writeMapped()/AVLBST.save() for reading"""
+    self.path = path
+    self._mmap = None
+    self._buf = None
+    self._file = open(path, "rb")
+    try:
+      self._map(path)
+    except:
+      self.close()
+      raise
+
+  def _map(self, path):
+    """private helper function: map the open file, read its header"""
+    # (too short for a header: can't be one of ours, and can't be
+    # mapped at all if it's empty)
+    if os.fstat(self._file.fileno()).st_size < HEADER.size:
+      raise ValueError("%s is not an AVLBST file" % path)
+    self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    buf = memoryview(self._mmap)
+    self._buf = buf
+    magic, kind, order, count, keysOffset, keyIndexOffset, valuesOffset, \
+      valueIndexOffset = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+      raise ValueError("%s is not an AVLBST file" % path)
+    if order != _byteOrder():
+      raise ValueError("%s was written on a machine with other byte order" % path)
+    self.size = count
+    if kind == b"p":
+      index = buf[keyIndexOffset:keyIndexOffset + 8*(count+1)].cast("Q")
+      self._keys = _PickledKeys(buf, keysOffset, index)
+    else:
+      self._keys = buf[keysOffset:keysOffset + 8*count].cast(kind.decode())
+    self._valuesOffset = valuesOffset
+    self._valueIndex = buf[valueIndexOffset:valueIndexOffset + 8*(count+1)].cast("Q")
+
+  def __repr__(self):
+    return "%s(%r)" % (self.__class__.__name__, self.path)
+  def __str__(self):
+    return "Size: %d, File: %s" % (self.size, self.path)
+
+  def close(self):
+    """unmap and close the file"""
+    # views into the map have to go before the map itself
+    self._keys = None
+    self._valueIndex = None
+    if self._buf is not None:
+      self._buf.release()
+      self._buf = None
+    if self._mmap is not None:
+      self._mmap.close()
+    self._file.close()
+
+  def __enter__(self):
+    return self
+  def __exit__(self, *exc):
+    self.close()
+
+  def getSize(self):
+    """return number of keys"""
+    return self.size
+  def __len__(self):
+    """return number of keys"""
+    return self.size
+  def isEmpty(self):
+    """return True if there are no keys, False if not"""
+    return self.size == 0
+
+  def get(self, key, default=None):
+    """return value for key, or default if key not found"""
+    i = self._index(key)
+    if i < 0:
+      return default
+    return self._value(i)
+
+  def contains(self, key):
+    """return True if key in file, False if not"""
+    return self._index(key) >= 0
+  def __contains__(self, key):
+    """return True if key in file, False if not"""
+    return self._index(key) >= 0
+
+  def select(self, i):
+    """return (key,value) pair of i-th smallest key (0=min)"""
+    if i < 0:
+      i += self.size
+    if i < 0 or i >= self.size:
+      raise IndexError("select() error: index out of range (%s)" % str(i))
+    return (self._keys[i], self._value(i))
+
+  def peekMin(self):
+    """return (key,value) pair with smallest key, or None if empty"""
+    if self.size == 0:
+      return None
+    return self.select(0)
+
+  def peekMax(self):
+    """return (key,value) pair with largest key, or None if empty"""
+    if self.size == 0:
+      return None
+    return self.select(-1)
+
+  def __iter__(self):
+    """iterate over keys in order"""
+    return self.keys()
+
+  def keys(self, reverse=False):
+    """generate keys in order (largest first if reverse)"""
+    for i in self._positions(0, self.size, reverse):
+      yield self._keys[i]
+
+  def values(self, reverse=False):
+    """generate values in key order (largest key first if reverse)"""
+    for i in self._positions(0, self.size, reverse):
+      yield self._value(i)
+
+  def items(self, reverse=False):
+    """generate (key,value) pairs in key order (largest first if reverse)"""
+    for i in self._positions(0, self.size, reverse):
+      yield (self._keys[i], self._value(i))
+
+  def irange(self, lo=None, hi=None, inclusive=(True,True), reverse=False):
+    """generate keys between lo and hi (None=unbounded)"""
+    start, stop = self._bounds(lo, hi, inclusive)
+    for i in self._positions(start, stop, reverse):
+      yield self._keys[i]
+
+  def irangeItems(self, lo=None, hi=None, inclusive=(True,True), reverse=False):
+    """generate (key,value) pairs for keys between lo and hi"""
+    start, stop = self._bounds(lo, hi, inclusive)
+    for i in self._positions(start, stop, reverse):
+      yield (self._keys[i], self._value(i))
+
+  def countRange(self, lo=None, hi=None, inclusive=(True,True)):
+    """return number of keys between lo and hi"""
+    start, stop = self._bounds(lo, hi, inclusive)
+    return max(stop - start, 0)
+
+  def _index(self, key):
+    """private helper function: position of key, or -1 if not found"""
+    i = bisect_left(self._keys, key)
+    if i < self.size and not key < self._keys[i]:
+      return i
+    return -1
+
+  def _bounds(self, lo, hi, inclusive):
+    """private helper function: positions [start,stop) of keys in range"""
+    if lo is None:
+      start = 0
+    elif inclusive[0]:
+      start = bisect_left(self._keys, lo)
+    else:
+      start = bisect_right(self._keys, lo)
+    if hi is None:
+      stop = self.size
+    elif inclusive[1]:
+      stop = bisect_right(self._keys, hi)
+    else:
+      stop = bisect_left(self._keys, hi)
+    return start, stop
+
+  def _positions(self, start, stop, reverse):
+    """private helper function: range of positions, maybe backwards"""
+    if reverse:
+      return range(stop - 1, start - 1, -1)
+    return range(start, stop)
+
+  def _value(self, i):
+    """private helper function: decode i-th value"""
+    start = self._valuesOffset
+    return pickle.loads(self._buf[start + self._valueIndex[i]:
+                                  start + self._valueIndex[i+1]])
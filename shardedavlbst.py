@@ -0,0 +1,385 @@
+"""
+Range-partitioned AVLBST spread over worker processes
+
+One AVLBST only ever uses one core (the GIL), so ShardedAVLBST
+splits the key space into ranges and keeps each range in its own
+AVLBST, in its own worker process:
+
+    shard 0: keys < bounds[0]
+    shard i: bounds[i-1] <= keys < bounds[i]
+    shard n: keys >= bounds[-1]
+
+Single-key calls (insert/get/remove/...) go to the one shard that
+can hold the key. Batch calls (insertMany/getMany/...) are cut into
+one piece per shard, and all the pieces are sent before any answer
+is read, so the shards work on them at the same time: batches are
+where the extra cores pay off. Since the shards are ranges, ordered
+iteration and range scans just read the shards one after another,
+in chunks.
+
+When a shard grows past maxShardSize it's split at its quantile
+keys into as few shards as keep each one within maxShardSize (new
+workers take the upper pieces), so boundaries follow the data: one
+insert too many splits it at its median, one big batch may cut it
+into many pieces. fromSorted()/fromIterable() choose the boundaries
+from the data up front.
+
+Keys and values are pickled to and from the workers. Call close()
+(or use "with ShardedAVLBST() as tree:") to stop the workers.
+"""
+
+from avlbst import AVLBST
+from bisect import bisect_right
+from itertools import islice
+from multiprocessing import Pipe, Process
+
+def _shardWorker(conn, items):
+  """worker process: run method calls from conn on one AVLBST"""
+  tree = AVLBST.fromSorted(items)
+  while True:
+    method, args = conn.recv()
+    if method == "close":
+      conn.close()
+      return
+    try:
+      if method == "scan":
+        result = _scan(tree, *args)
+      elif method == "splitOff":
+        tree, right = tree.split(args[0])
+        result = list(right.items())
+      else:
+        result = getattr(tree, method)(*args)
+      conn.send((True, result))
+    except Exception as e:
+      conn.send((False, e))
+
+def _scan(tree, lo, hi, inclusive, reverse, limit):
+  """worker: list of up to limit (key,value) pairs between lo and hi"""
+  return list(islice(tree.irangeItems(lo, hi, inclusive, reverse), limit))
+
+class ShardedAVLBST(object):
+
+  def __init__(self, bounds=None, maxShardSize=100000, chunkSize=1000):
+    """sharded tree constructor: one empty shard per range between bounds"""
+    if bounds is None:
+      bounds = []
+    for i in range(1, len(bounds)):
+      if not bounds[i-1] < bounds[i]:
+        raise ValueError("ShardedAVLBST bounds must be strictly increasing")
+    self.maxShardSize = maxShardSize
+    self.chunkSize = chunkSize      # pairs per message when scanning
+    self.bounds = []
+    self.sizes = []
+    self._conns = []
+    self._procs = []
+    self._startShard(0, [])
+    for bound in bounds:
+      self.bounds.append(bound)
+      self._startShard(len(self._conns), [])
+
+  @classmethod
+  def fromSorted(cls, items, shards=4, maxShardSize=100000):
+    """build from (key,value) pairs sorted by key, shards of equal size"""
+    # boundaries at the quantiles of the keys; each shard then gets
+    # its whole range as one batch (which it bulk-loads)
+    items = list(items)
+    bounds = []
+    for i in range(1, shards):
+      j = i * len(items) // shards
+      if 0 < j < len(items) and (len(bounds) == 0 or bounds[-1] < items[j][0]):
+        bounds.append(items[j][0])
+    tree = cls(bounds, maxShardSize)
+    tree.insertMany(items)
+    return tree
+
+  @classmethod
+  def fromIterable(cls, items, shards=4, maxShardSize=100000):
+    """build from (key,value) pairs in any order (first of duplicates kept)"""
+    return cls.fromSorted(AVLBST.fromIterable(items).items(), shards,
+                          maxShardSize)
+
+  def __repr__(self):
+    return "%s(%r)" % (self.__class__.__name__, self.bounds)
+  def __str__(self):
+    return "Size: %d, Shards: %d" % (len(self), len(self._conns))
+
+  def close(self):
+    """stop all the worker processes"""
+    for conn in self._conns:
+      conn.send(("close", ()))
+      conn.close()
+    for proc in self._procs:
+      proc.join()
+    self._conns = []
+    self._procs = []
+
+  def __enter__(self):
+    return self
+  def __exit__(self, *exc):
+    self.close()
+
+  def shardSizes(self):
+    """return list of number of keys in each shard, in key order"""
+    return self._callAll("getSize")
+
+  def getSize(self):
+    """return number of keys in all shards"""
+    return sum(self.shardSizes())
+  def __len__(self):
+    """return number of keys in all shards"""
+    return self.getSize()
+
+  # one key: one shard
+
+  def insert(self, key, value):
+    """add key-value pair, return True if added (False if key already in)"""
+    i = self._shardFor(key)
+    added = self._call(i, "insert", key, value)
+    if added:
+      self._grew(i, 1)
+    return added
+
+  def upsert(self, key, value):
+    """set value for key, adding key if needed; return True if added"""
+    i = self._shardFor(key)
+    added = self._call(i, "upsert", key, value)
+    if added:
+      self._grew(i, 1)
+    return added
+
+  def remove(self, key):
+    """remove key, return True if it was in the tree"""
+    i = self._shardFor(key)
+    removed = self._call(i, "remove", key)
+    if removed:
+      self.sizes[i] -= 1
+    return removed
+
+  def get(self, key, default=None):
+    """return value for key (default if not found)"""
+    return self._call(self._shardFor(key), "get", key, default)
+
+  def update(self, key, value):
+    """change value of key, return True if found"""
+    return self._call(self._shardFor(key), "update", key, value)
+
+  def contains(self, key):
+    """return True if key in tree, False if not"""
+    return self._call(self._shardFor(key), "contains", key)
+  def __contains__(self, key):
+    """return True if key in tree, False if not"""
+    return self.contains(key)
+
+  # batches: one piece per shard, all shards at once
+
+  def insertMany(self, items):
+    """insert batch of (key,value) pairs, return list of True/False (inserted)"""
+    items = list(items)
+    results, counts = self._batch("insertMany", items,
+                                  [item[0] for item in items])
+    # backwards, so splitting a shard doesn't move the ones still to do
+    for i in range(len(counts) - 1, -1, -1):
+      if counts[i] > 0:
+        self._grew(i, counts[i])
+    return results
+
+  def removeMany(self, keys):
+    """remove batch of keys, return list of True/False (removed)"""
+    keys = list(keys)
+    results, counts = self._batch("removeMany", keys, keys)
+    for i in range(len(counts)):
+      self.sizes[i] -= counts[i]
+    return results
+
+  def getMany(self, keys, default=None):
+    """return list of values for batch of keys (default if not found)"""
+    keys = list(keys)
+    return self._batch("getMany", keys, keys, default)[0]
+
+  def updateMany(self, items):
+    """update values for batch of (key,value) pairs, return list of True/False"""
+    items = list(items)
+    return self._batch("updateMany", items, [item[0] for item in items])[0]
+
+  # ordered scans: shards one after another, chunkSize pairs at a time
+
+  def __iter__(self):
+    """iterate over keys in order"""
+    return self.keys()
+
+  def keys(self, reverse=False):
+    """generate keys in order (largest first if reverse)"""
+    for key, value in self.irangeItems(reverse=reverse):
+      yield key
+
+  def values(self, reverse=False):
+    """generate values in key order (largest key first if reverse)"""
+    for key, value in self.irangeItems(reverse=reverse):
+      yield value
+
+  def items(self, reverse=False):
+    """generate (key,value) pairs in key order (largest first if reverse)"""
+    return self.irangeItems(reverse=reverse)
+
+  def irange(self, lo=None, hi=None, inclusive=(True,True), reverse=False):
+    """generate keys between lo and hi (None=unbounded)"""
+    for key, value in self.irangeItems(lo, hi, inclusive, reverse):
+      yield key
+
+  def irangeItems(self, lo=None, hi=None, inclusive=(True,True), reverse=False):
+    """generate (key,value) pairs for keys between lo and hi"""
+    # the tree mustn't be changed while this generator is being used
+    shards = self._shardsBetween(lo, hi)
+    if reverse:
+      shards.reverse()
+    for i in shards:
+      start, stop, bounds = lo, hi, inclusive
+      while True:
+        chunk = self._call(i, "scan", start, stop, bounds, reverse,
+                           self.chunkSize)
+        for item in chunk:
+          yield item
+        if len(chunk) < self.chunkSize:
+          break
+        # carry on just past the last key we got
+        if reverse:
+          stop, bounds = chunk[-1][0], (bounds[0], False)
+        else:
+          start, bounds = chunk[-1][0], (False, bounds[1])
+
+  def countRange(self, lo=None, hi=None, inclusive=(True,True)):
+    """return number of keys between lo and hi"""
+    shards = self._shardsBetween(lo, hi)
+    return sum(self._scatter([(i, "countRange", (lo, hi, inclusive))
+                              for i in shards]))
+
+  # routing and rebalancing
+
+  def _shardFor(self, key):
+    """private helper function: index of the shard that holds key"""
+    return bisect_right(self.bounds, key)
+
+  def _shardsBetween(self, lo, hi):
+    """private helper function: indices of shards that may hold keys lo..hi"""
+    first = 0
+    last = len(self.bounds)
+    if lo is not None:
+      first = self._shardFor(lo)
+    if hi is not None:
+      last = self._shardFor(hi)
+    return list(range(first, last + 1))
+
+  def _batch(self, method, batch, keys, *extra):
+    """private helper function: run method on batch split up by shard"""
+    # returns (results in batch order, [count of True results per shard])
+    pieces = {}
+    for j in range(len(batch)):
+      pieces.setdefault(self._shardFor(keys[j]), []).append(j)
+    shards = list(pieces)
+    calls = []
+    for i in shards:
+      calls.append((i, method, ([batch[j] for j in pieces[i]],) + extra))
+    answers = self._scatter(calls)
+    results = [None] * len(batch)
+    counts = [0] * len(self._conns)
+    for i, shardAnswers in zip(shards, answers):
+      for j, answer in zip(pieces[i], shardAnswers):
+        results[j] = answer
+        if answer is True:
+          counts[i] += 1
+    return results, counts
+
+  def _grew(self, i, added):
+    """private helper function: shard i got added keys; split it if too big"""
+    self.sizes[i] += added
+    if self.sizes[i] > self.maxShardSize:
+      self._splitShard(i)
+
+  def _splitShard(self, i):
+    """private helper function: cut shard i into shards of <= maxShardSize"""
+    # split points from the data: the shard's quantile keys (just the
+    # median if it's only a little too big, after one more insert).
+    # pieces are moved to new shards from the top down, so shard i
+    # keeps the bottom one
+    size = self.sizes[i]
+    pieces = -(-size // self.maxShardSize)
+    cuts = [self._call(i, "select", p * size // pieces)[0]
+            for p in range(1, pieces)]
+    for key in reversed(cuts):
+      upper = self._call(i, "splitOff", key)
+      self.sizes[i] -= len(upper)
+      self.bounds.insert(i, key)
+      self._startShard(i + 1, upper)
+
+  def _startShard(self, i, items):
+    """private helper function: start worker for shard i, holding items"""
+    conn, child = Pipe()
+    proc = Process(target=_shardWorker, args=(child, items), daemon=True)
+    proc.start()
+    child.close()
+    self._conns.insert(i, conn)
+    self._procs.insert(i, proc)
+    self.sizes.insert(i, len(items))
+
+  def _callAll(self, method, *args):
+    """private helper function: call method on every shard, in parallel"""
+    return self._scatter([(i, method, args) for i in range(len(self._conns))])
+
+  def _scatter(self, calls):
+    """private helper function: send all (shard, method, args) calls, then
+       return their results (in the same order)"""
+    # every reply is read before any error is raised: a reply left in
+    # a pipe would be taken as the answer to that shard's next call
+    sent = []
+    try:
+      for i, method, args in calls:
+        self._send(i, method, *args)
+        sent.append(i)
+    finally:
+      replies = [self._conns[i].recv() for i in sent]
+    for ok, result in replies:
+      if not ok:
+        raise result
+    return [result for ok, result in replies]
+
+  def _call(self, i, method, *args):
+    """private helper function: call method on shard i, return result"""
+    self._send(i, method, *args)
+    return self._receive(i)
+
+  def _send(self, i, method, *args):
+    """private helper function: ask shard i to run method(*args)"""
+    self._conns[i].send((method, args))
+
+  def _receive(self, i):
+    """private helper function: result from shard i (raising its errors)"""
+    ok, result = self._conns[i].recv()
+    if not ok:
+      raise result
+    return result
+
+# ---------------------------------------------- #
+
+def main():
+  """some simple test code"""
+  from random import shuffle
+  from time import perf_counter
+  n = 400000
+  items = [(i, i) for i in range(n)]
+  shuffle(items)
+  bst = AVLBST()
+  start = perf_counter()
+  for j in range(0, n, 10000):
+    bst.insertMany(items[j:j+10000])
+  print("one AVLBST:       %8.4f sec" % (perf_counter() - start))
+  with ShardedAVLBST.fromIterable(items[:1000], shards=4,
+                                  maxShardSize=n // 2) as tree:
+    start = perf_counter()
+    for j in range(1000, n, 10000):
+      tree.insertMany(items[j:j+10000])
+    print("ShardedAVLBST:    %8.4f sec" % (perf_counter() - start))
+    print(tree, tree.shardSizes())
+    assert(list(tree.keys()) == list(range(n)))
+
+if __name__ == "__main__":
+  main()
@@ -1,5 +1,15 @@
-import unittest, io
+import unittest, io, os, tempfile, json
 from avlbst import *
+from avlbstpool import AVLBSTPool
+from concurrentavlbst import ConcurrentAVLBST, RWLock
+from shardedavlbst import ShardedAVLBST
+from avlbstprofiler import AVLBSTProfiler, LatencyHistogram
+from avlbstmonoid import Monoid
+import threading, time
+try:
+  import numpy
+except ImportError:
+  numpy = None
 from random import randrange, choice, shuffle
 
 class TestAVLBSTMethods(unittest.TestCase):
@@ -74,6 +84,63 @@ class TestAVLBSTMethods(unittest.TestCase):
     imin = self.keys.index(min(self.keys))
     self.assertEqual(self.bst.findMin().getValue(), self.values[imin])
 
+  def test_minmaxcached(self):
+    self.assertEqual(self.bst.findMin(), None)
+    self.assertEqual(self.bst.findMax(), None)
+    keys = list(range(100))
+    shuffle(keys)
+    for k in keys:
+      self.bst.insert(k, k)
+    while len(keys) > 0:
+      self.assertEqual(self.bst.findMin().getKey(), min(keys))
+      self.assertEqual(self.bst.findMax().getKey(), max(keys))
+      key = choice(keys)
+      self.bst.remove(key)
+      keys.remove(key)
+    self.assertEqual(self.bst.findMin(), None)
+    self.assertEqual(self.bst.findMax(), None)
+    bst = AVLBST.fromSorted([(1,"a"),(2,"b"),(3,"c")])
+    self.assertEqual(bst.findMin().getValue(), "a")
+    self.assertEqual(bst.findMax().getValue(), "c")
+
+  def test_popminmax(self):
+    self.assertEqual(self.bst.peekMin(), None)
+    self.assertEqual(self.bst.peekMax(), None)
+    keys = list(range(200))
+    shuffle(keys)
+    for k in keys:
+      self.bst.insert(k, str(k))
+    self.assertEqual(self.bst.peekMin(), (0, "0"))
+    self.assertEqual(self.bst.peekMax(), (199, "199"))
+    keys.sort()
+    while len(keys) > 0:
+      if choice([True, False]):
+        self.assertEqual(self.bst.popMin(), (keys[0], str(keys[0])))
+        keys.pop(0)
+      else:
+        self.assertEqual(self.bst.popMax(), (keys[-1], str(keys[-1])))
+        keys.pop()
+      self.assertEqual(self.bst.checkInvariants(), True)
+      self.assertEqual(self.bst.getSize(), len(keys))
+      if len(keys) > 0:
+        self.assertEqual(self.bst.findMin().getKey(), keys[0])
+        self.assertEqual(self.bst.findMax().getKey(), keys[-1])
+    self.assertEqual(self.bst.findMin(), None)
+    self.assertEqual(self.bst.findMax(), None)
+
+  def test_popbatch(self):
+    for i in range(len(self.keys)):
+      self.bst.insert(self.keys[i], self.values[i])
+    batch = self.bst.popMinBatch(3)
+    self.assertEqual([k for k,v in batch], list("ABC"))
+    batch = self.bst.popMaxBatch(2)
+    self.assertEqual([k for k,v in batch], list("QP"))
+    self.assertEqual(self.bst.getSize(), len(self.keys) - 5)
+    batch = self.bst.popMinBatch(100)
+    self.assertEqual(len(batch), len(self.keys) - 5)
+    self.assertEqual(self.bst.isEmpty(), True)
+    self.assertEqual(self.bst.popMinBatch(1), [])
+
   def test_insertduplicate(self):
     for i in range(len(self.keys)):
       k = self.keys[i]
@@ -81,9 +148,9 @@ class TestAVLBSTMethods(unittest.TestCase):
       self.bst.insert(k,v)
     output = io.StringIO()
     sys.stdout = output
-    self.bst.insert(k,v)
-    emsg = "insert() error: trying to insert duplicate key (%s)" % str(k)
-    self.assertEqual(output.getvalue().strip('\n'), emsg)
+    self.assertEqual(self.bst.insert(k,"other"), False)
+    self.assertEqual(self.bst.get(k), v)
+    self.assertEqual(output.getvalue(), "")
     self.assertEqual(self.bst.checkInvariants(), True)
     self.assertEqual(self.bst.getSize(), len(self.keys))
 
@@ -91,9 +158,8 @@ class TestAVLBSTMethods(unittest.TestCase):
     output = io.StringIO()
     sys.stdout = output
     key = "supercalifragilistic"
-    self.bst.remove(key)
-    emsg = "remove() error: no such key (%s) to remove." % str(key)
-    self.assertEqual(output.getvalue().strip('\n'), emsg)
+    self.assertEqual(self.bst.remove(key), False)
+    self.assertEqual(output.getvalue(), "")
     self.assertEqual(self.bst.checkInvariants(), True)
     self.assertEqual(self.bst.getSize(), 0)
 
@@ -148,9 +214,10 @@ class TestAVLBSTMethods(unittest.TestCase):
     output = io.StringIO()
     sys.stdout = output
     key = "supercalifragilistic"
-    self.bst.update(key,"hello")
-    emsg = "update() error: no such node with key (%s) to update." % str(key)
-    self.assertEqual(output.getvalue().strip('\n'), emsg)
+    self.assertEqual(self.bst.update(key,"hello"), False)
+    self.assertEqual(self.bst.update("A","bye"), True)
+    self.assertEqual(self.bst.get("A"), "bye")
+    self.assertEqual(output.getvalue(), "")
     self.assertEqual(self.bst.checkInvariants(), True)
     self.assertEqual(self.bst.getSize(), len(self.keys))
 
@@ -167,11 +234,146 @@ class TestAVLBSTMethods(unittest.TestCase):
     key = "supercalifragilistic"
     result = self.bst.get(key)
     self.assertEqual(result, None)
-    emsg = "get() error: no such node with key (%s) to get." % str(key)
-    self.assertEqual(output.getvalue().strip('\n'), emsg)
+    self.assertEqual(self.bst.get(key, "default"), "default")
+    self.assertEqual(output.getvalue(), "")
     self.assertEqual(self.bst.checkInvariants(), True)
     self.assertEqual(self.bst.getSize(), len(self.keys))
 
+  def test_mapping(self):
+    for i in range(len(self.keys)):
+      self.bst[self.keys[i]] = self.values[i]
+    self.assertEqual(self.bst.checkInvariants(), True)
+    self.assertEqual(self.bst["C"], self.values[2])
+    self.assertRaises(KeyError, lambda: self.bst["Z"])
+    self.assertEqual("C" in self.bst, True)
+    self.assertEqual("Z" in self.bst, False)
+    self.bst["C"] = "new"
+    self.assertEqual(self.bst["C"], "new")
+    self.assertEqual(len(self.bst), len(self.keys))
+    del self.bst["C"]
+    self.assertEqual("C" in self.bst, False)
+    with self.assertRaises(KeyError):
+      del self.bst["C"]
+    self.assertEqual(self.bst.pop("D"), self.values[3])
+    self.assertEqual(self.bst.pop("D", "gone"), "gone")
+    self.assertRaises(KeyError, self.bst.pop, "D")
+    self.assertEqual(self.bst.setdefault("A", 0), self.values[0])
+    self.assertEqual(self.bst.setdefault("Cc", 0), 0)
+    self.assertEqual(self.bst["Cc"], 0)
+    self.bst.update({"A": 1, "Z": 2}, B=3)
+    self.bst.update([("Zz", 4)])
+    self.assertEqual([self.bst[k] for k in ["A", "B", "Z", "Zz"]], [1, 3, 2, 4])
+    self.assertEqual(self.bst.popitem(), ("A", 1))
+    self.assertEqual(self.bst.checkInvariants(), True)
+    self.assertEqual(self.bst, AVLBST.fromIterable(self.bst.items()))
+    self.assertEqual(self.bst == dict(self.bst.items()), True)
+    self.assertNotEqual(self.bst, AVLBST())
+    # views: live, sized, and (keys/items) set-like
+    keys = self.bst.keys()
+    self.assertEqual(len(keys), len(self.bst))
+    self.assertEqual("B" in keys, True)
+    self.assertEqual(keys & {"B", "Q", "nope"}, {"B", "Q"})
+    self.assertEqual(keys, AVLBST.fromIterable(self.bst.items()).keys())
+    self.assertEqual(keys == self.bst.snapshot().keys(), True)
+    self.assertEqual(keys == AVLBST().keys(), False)
+    self.assertEqual(keys - set("EFGHIJKLMNOPQ"), {"B", "Cc", "Z", "Zz"})
+    self.assertEqual(("B", 3) in self.bst.items(), True)
+    self.assertEqual(("B", 4) in self.bst.items(), False)
+    self.assertEqual(3 in self.bst.values(), True)
+    self.assertEqual(len(self.bst.values()), len(self.bst))
+    self.assertEqual(self.bst.items() == dict(self.bst).items(), True)
+    self.bst["Zzz"] = 5
+    self.assertEqual(len(keys), len(self.bst))
+    self.assertEqual(next(reversed(keys)), "Zzz")
+    self.assertEqual(next(reversed(self.bst.items())), ("Zzz", 5))
+    self.bst.clear()
+    self.assertEqual(len(self.bst), 0)
+    self.assertRaises(KeyError, self.bst.popitem)
+    self.assertEqual(self.bst.popMin(), None)
+    # persistent trees copy a shared node before setting its value
+    self.bst["A"] = 1
+    snap = self.bst.snapshot()
+    self.bst["A"] = 2
+    self.assertEqual((snap["A"], self.bst["A"]), (1, 2))
+
+  def test_upsert(self):
+    self.assertEqual(self.bst.upsert("A", 1), True)
+    self.assertEqual(self.bst.upsert("A", 2), False)
+    self.assertEqual(self.bst["A"], 2)
+    words = "the cat and the hat and the bat".split()
+    for word in words:
+      self.bst.compute(word, lambda n: n + 1, 0)
+    self.assertEqual(self.bst["the"], 3)
+    self.assertEqual(self.bst["cat"], 1)
+    for word in words:
+      self.bst.merge(word, 1, lambda old, new: old + new)
+    self.assertEqual(self.bst["the"], 6)
+    self.assertEqual(self.bst.merge("dog", [1], None), True)
+    self.assertEqual(self.bst.merge("dog", [2], lambda a, b: a + b), False)
+    self.assertEqual(self.bst["dog"], [1, 2])
+    self.assertEqual(self.bst.checkInvariants(), True)
+    # a failing fn changes nothing
+    self.assertRaises(TypeError, self.bst.compute, "new", lambda n: n + 1)
+    self.assertEqual("new" in self.bst, False)
+    # persistent: snapshot keeps the old values
+    snap = self.bst.snapshot()
+    self.bst.compute("the", lambda n: n * 10)
+    self.bst.upsert("A", 3)
+    self.assertEqual((snap["the"], self.bst["the"]), (6, 60))
+    self.assertEqual((snap["A"], self.bst["A"]), (2, 3))
+    self.assertEqual(self.bst.checkInvariants(), True)
+
+  def test_aggregate(self):
+    self.assertRaises(ValueError, self.bst.aggregate)
+    bst = AVLBST(aggregate="sum")
+    self.assertEqual(bst.aggregate(), 0)
+    keys = list(range(200))
+    shuffle(keys)
+    for k in keys:
+      bst.insert(k, k)
+    for k in keys[:50]:
+      bst.remove(k)
+    bst.update(keys[60], 1000)
+    bst.compute(keys[70], lambda v: v + 5)
+    ref = dict((k, k) for k in keys[50:])
+    ref[keys[60]] = 1000
+    ref[keys[70]] += 5
+    self.assertEqual(bst.checkInvariants(), True)
+    self.assertEqual(bst.aggregate(), sum(ref.values()))
+    for lo, hi in [(10, 20), (-5, 300), (150, 149), (None, 100), (37, None)]:
+      expected = sum(v for k,v in ref.items()
+                     if (lo is None or lo <= k) and (hi is None or k <= hi))
+      self.assertEqual(bst.aggregate(lo, hi), expected)
+    expected = sum(v for k,v in ref.items() if 10 < k < 20)
+    self.assertEqual(bst.aggregate(10, 20, (False,False)), expected)
+    # min/max/count, and a function that isn't commutative
+    tree = AVLBST.fromSorted([(k, k*k % 17) for k in range(30)], "max")
+    self.assertEqual(tree.aggregate(3, 9), max(k*k % 17 for k in range(3, 10)))
+    self.assertEqual(tree.aggregate(40, 50), None)
+    self.assertEqual(tree.removeMany([4, 5, 99]), [True, True, False])
+    self.assertEqual(tree.aggregate(3, 9), max(k*k % 17 for k in [3,6,7,8,9]))
+    self.assertEqual(bst.removeMany([keys[60], -1]), [True, False])
+    self.assertEqual(bst.aggregate(), sum(ref.values()) - 1000)
+    self.assertEqual(bst.checkInvariants(), True)
+    tree = AVLBST.fromIterable([(k, 0) for k in range(30)], "count")
+    self.assertEqual(tree.aggregate(5, 14), 10)
+    concat = Monoid(lambda a, b: a + b, "")
+    tree = AVLBST(aggregate=concat)
+    for k in "QWERTYUIOPASDFGHJKL":
+      tree[k] = k.lower()
+    self.assertEqual(tree.aggregate("D", "K"), "defghijk")
+    tree.popMin()
+    tree["J"] = "!"
+    self.assertEqual(tree.aggregate("D", "K"), "defghi!k")
+    # snapshots and split/join keep aggregates right
+    snap = tree.snapshot()
+    tree["E"] = "?"
+    left, right = tree.split("H")
+    self.assertEqual((left.aggregate(), right.aggregate()), ("d?fg", "hi!klopqrstuwy"))
+    self.assertEqual(AVLBST.join(left, right).checkInvariants(), True)
+    self.assertEqual(snap.aggregate("D", "K"), "defghi!k")
+    self.assertRaises(ValueError, bst.union, AVLBST())
+
   def test_getkeys(self):
     for i in range(len(self.keys)):
       k = self.keys[i]
@@ -197,6 +399,340 @@ class TestAVLBSTMethods(unittest.TestCase):
     self.assertEqual(self.bst.checkInvariants(), True)
     self.assertEqual(len(self.bst), len(self.keys))
 
+  def test_iterators(self):
+    for i in range(len(self.keys)):
+      self.bst.insert(self.keys[i], self.values[i])
+    items = list(zip(self.keys, self.values))
+    self.assertEqual(list(self.bst), self.keys)
+    self.assertEqual(list(reversed(self.bst)), self.keys[::-1])
+    self.assertEqual(list(self.bst.keys()), self.keys)
+    self.assertEqual(list(reversed(self.bst.keys())), self.keys[::-1])
+    self.assertEqual(list(self.bst.values()), self.values)
+    self.assertEqual(list(reversed(self.bst.values())), self.values[::-1])
+    self.assertEqual(list(self.bst.items()), items)
+    self.assertEqual(list(reversed(self.bst.items())), items[::-1])
+    # early termination
+    it = iter(self.bst)
+    self.assertEqual(next(it), "A")
+    self.assertEqual(next(it), "B")
+    self.assertEqual(list(AVLBST()), [])
+    self.assertEqual(list(reversed(AVLBST())), [])
+
+  def test_irange(self):
+    for i in range(len(self.keys)):
+      self.bst.insert(self.keys[i], self.values[i])
+    self.assertEqual("".join(self.bst.irange("C", "G")), "CDEFG")
+    self.assertEqual("".join(self.bst.irange("C", "G", (False,False))), "DEF")
+    self.assertEqual("".join(self.bst.irange("C", "G", reverse=True)), "GFEDC")
+    self.assertEqual("".join(self.bst.irange("C", "G", (False,True), True)),
+                     "GFED")
+    self.assertEqual("".join(self.bst.irange(hi="C")), "ABC")
+    self.assertEqual("".join(self.bst.irange("O")), "OPQ")
+    self.assertEqual("".join(self.bst.irange("Bb", "Dd")), "CD")
+    self.assertEqual(list(self.bst.irange("X", "Z")), [])
+    self.assertEqual(list(self.bst.irange("G", "C")), [])
+    self.assertEqual(list(self.bst.irangeItems("A", "B")),
+                     [("A", self.values[0]), ("B", self.values[1])])
+    self.assertEqual(self.bst.countRange("C", "G"), 5)
+    self.assertEqual(self.bst.countRange(), len(self.keys))
+
+  def test_floorceiling(self):
+    for k in "BDF":
+      self.bst.insert(k, k.lower())
+    self.assertEqual(self.bst.floor("D"), ("D", "d"))
+    self.assertEqual(self.bst.floor("E"), ("D", "d"))
+    self.assertEqual(self.bst.floor("A"), None)
+    self.assertEqual(self.bst.ceiling("D"), ("D", "d"))
+    self.assertEqual(self.bst.ceiling("C"), ("D", "d"))
+    self.assertEqual(self.bst.ceiling("G"), None)
+    self.assertEqual(self.bst.lower("D"), ("B", "b"))
+    self.assertEqual(self.bst.lower("B"), None)
+    self.assertEqual(self.bst.higher("D"), ("F", "f"))
+    self.assertEqual(self.bst.higher("F"), None)
+    self.assertEqual(AVLBST().floor("A"), None)
+
+  def test_cursor(self):
+    for i in range(len(self.keys)):
+      self.bst.insert(self.keys[i], self.values[i])
+    c = self.bst.cursor()
+    seen = []
+    while c.isValid():
+      seen.append(c.current()[0])
+      c.next()
+    self.assertEqual("".join(seen), "".join(self.keys))
+    self.assertEqual(c.next(), None)
+    c.seekLast()
+    seen = []
+    while c.isValid():
+      seen.append(c.current()[0])
+      c.prev()
+    self.assertEqual("".join(seen), "".join(reversed(self.keys)))
+    c = self.bst.cursor("Dd")
+    self.assertEqual(c.current(), ("E", self.values[4]))
+    self.assertEqual(c.prev()[0], "D")
+    self.assertEqual(c.next()[0], "E")
+    self.assertEqual(self.bst.cursor("Z").current(), None)
+    self.assertEqual(AVLBST().cursor().current(), None)
+    # delete moves on to the next key, and the cursor stays usable
+    c = self.bst.cursor("C")
+    self.assertEqual(c.delete()[0], "D")
+    self.assertEqual(c.delete()[0], "E")
+    self.assertEqual(c.next()[0], "F")
+    self.assertEqual(self.bst.contains("C"), False)
+    self.assertEqual(self.bst.contains("D"), False)
+    self.assertEqual(self.bst.checkInvariants(), True)
+    # any other change invalidates it
+    self.bst.insert("Cc", 1)
+    self.assertEqual(c.isValid(), False)
+    self.assertRaises(RuntimeError, c.next)
+    self.assertEqual(c.seek("C")[0], "Cc")
+    # so does copying a shared node in a persistent tree
+    snap = self.bst.snapshot()
+    c = self.bst.cursor()
+    self.bst.update("A", 5)
+    self.assertRaises(RuntimeError, c.current)
+    self.assertEqual(snap.cursor().current()[0], "A")
+
+  def test_ordstats(self):
+    keys = list(range(0, 400, 2))
+    shuffle(keys)
+    for k in keys:
+      self.bst.insert(k, str(k))
+    keys.sort()
+    for k in choice([keys[:50], keys[-50:]]):
+      self.bst.remove(k)
+      keys.remove(k)
+    self.assertEqual(self.bst.checkInvariants(), True)
+    self.assertEqual(self.bst.root.getSize(), len(keys))
+    for i in range(len(keys)):
+      self.assertEqual(self.bst.select(i), (keys[i], str(keys[i])))
+      self.assertEqual(self.bst.rank(keys[i]), i)
+      self.assertEqual(self.bst.countLessThan(keys[i]+1), i+1)
+    self.assertEqual(self.bst.select(-1), (keys[-1], str(keys[-1])))
+    self.assertEqual(list(self.bst.islice(2, 5)),
+                     [(k, str(k)) for k in keys[2:5]])
+    self.assertEqual(list(self.bst.islice(-3, reverse=True)),
+                     [(k, str(k)) for k in reversed(keys[-3:])])
+    self.assertEqual(list(self.bst.islice(5, 2)), [])
+    self.assertRaises(IndexError, self.bst.select, len(keys))
+    self.assertEqual(self.bst.median()[0], keys[(len(keys)-1)//2])
+    self.assertEqual(self.bst.rank(-1), 0)
+    self.assertEqual(self.bst.rank(1000), len(keys))
+    lo, hi = keys[10], keys[20]
+    self.assertEqual(self.bst.countRange(lo, hi), 11)
+    self.assertEqual(self.bst.countRange(lo, hi, (False,False)), 9)
+    self.assertEqual(self.bst.countRange(lo+1, hi-1), 9)
+    self.assertEqual(self.bst.countRange(hi, lo), 0)
+    self.assertEqual(AVLBST().median(), None)
+
+  def test_deleterange(self):
+    keys = list(range(1000))
+    shuffle(keys)
+    for k in keys:
+      self.bst.insert(k, k)
+    self.assertEqual(self.bst.deleteRange(100, 104), 5)
+    self.assertEqual(self.bst.checkInvariants(), True)
+    self.assertEqual(self.bst.deleteRange(200, 900, (True,False)), 700)
+    self.assertEqual(self.bst.checkInvariants(), True)
+    expected = [k for k in range(1000) if not (100 <= k <= 104 or 200 <= k < 900)]
+    self.assertEqual(self.bst.getKeys(), expected)
+    self.assertEqual(self.bst.deleteRange(5000, 6000), 0)
+    self.assertEqual(self.bst.deleteRange(907, 903), 0)
+    self.assertEqual(self.bst.deleteRange(905, 905, (True,False)), 0)
+    self.assertEqual(self.bst.deleteRange(905, 905, (False,True)), 0)
+    self.assertEqual(self.bst.getKeys(), expected)
+    self.assertEqual(self.bst.deleteRange(905, 905), 1)
+    expected.remove(905)
+    self.assertEqual(self.bst.deleteRange(), len(expected))
+    self.assertEqual(self.bst.isEmpty(), True)
+    self.assertEqual(self.bst.checkInvariants(), True)
+
+  def test_splitjoin(self):
+    keys = list(range(0, 200, 2))
+    shuffle(keys)
+    for k in keys:
+      self.bst.insert(k, str(k))
+    left, right = self.bst.split(101)
+    self.assertEqual(self.bst.isEmpty(), True)
+    self.assertEqual(left.getKeys(), list(range(0, 101, 2)))
+    self.assertEqual(right.getKeys(), list(range(102, 200, 2)))
+    self.assertEqual(left.checkInvariants(), True)
+    self.assertEqual(right.checkInvariants(), True)
+    self.assertRaises(ValueError, AVLBST.join, right, left)
+    bst = AVLBST.join(left, right)
+    self.assertEqual(left.isEmpty() and right.isEmpty(), True)
+    self.assertEqual(bst.getKeys(), sorted(keys))
+    self.assertEqual(bst.checkInvariants(), True)
+    left, right = bst.split(50)
+    self.assertEqual(left.findMax().getKey(), 48)
+    self.assertEqual(right.findMin().getKey(), 50)
+    small, rest = right.split(56)
+    bst = AVLBST.join(small, AVLBST())
+    self.assertEqual(bst.getKeys(), [50, 52, 54])
+    self.assertEqual(bst.checkInvariants(), True)
+
+  def test_setoperations(self):
+    for workers in [None, 2]:
+      for trial in range(3):
+        a = set(randrange(3000) for i in range(randrange(1, 1000)))
+        b = set(randrange(3000) for i in range(randrange(1, 1000)))
+        for op, expected in [("union", a | b), ("intersection", a & b),
+                             ("difference", a - b)]:
+          A = AVLBST.fromIterable((k, "a") for k in a)
+          B = AVLBST.fromIterable((k, "b") for k in b)
+          C = getattr(A, op)(B, workers)
+          self.assertEqual(C.checkInvariants(), True)
+          self.assertEqual(C.getKeys(), sorted(expected))
+          self.assertEqual(A.isEmpty() and B.isEmpty(), True)
+          for k in a & expected:
+            self.assertEqual(C.get(k), "a")
+    self.assertEqual(AVLBST().union(AVLBST()).isEmpty(), True)
+
+  def test_batches(self):
+    for k in range(0, 100, 2):
+      self.bst.insert(k, "old")
+    batch = [(k, "new") for k in range(0, 200, 3)]
+    shuffle(batch)
+    batch.append((3, "dup"))
+    results = self.bst.insertMany(batch)
+    self.assertEqual(self.bst.checkInvariants(), True)
+    for i in range(len(batch)):
+      key, value = batch[i]
+      inserted = value == "new" and not (key < 100 and key % 2 == 0)
+      self.assertEqual(results[i], inserted)
+      if key < 100 and key % 2 == 0:
+        self.assertEqual(self.bst.get(key), "old")
+      else:
+        self.assertEqual(self.bst.get(key), "new")
+    keys = set(range(0, 100, 2)) | set(range(0, 200, 3))
+    self.assertEqual(self.bst.getKeys(), sorted(keys))
+    probe = [5, 6, 7, 6, 1000, -1, 198]
+    self.assertEqual(self.bst.getMany(probe, "x"),
+                     ["x", "old", "x", "old", "x", "x", "new"])
+    self.assertEqual(self.bst.updateMany([(6, "a"), (7, "b"), (9, "c")]),
+                     [True, False, True])
+    self.assertEqual(self.bst.getMany([6, 9]), ["a", "c"])
+    results = self.bst.removeMany([6, 7, 6, 9, 1000])
+    self.assertEqual(results, [True, False, False, True, False])
+    self.assertEqual(self.bst.checkInvariants(), True)
+    self.assertEqual(self.bst.getKeys(), sorted(keys - set([6, 9])))
+    # batches bigger than the tree take the merge-and-rebuild path
+    results = self.bst.insertMany([(k, k) for k in range(-200, 0)] + [(0, 0)])
+    self.assertEqual(results, [True] * 200 + [False])
+    self.assertEqual(self.bst.checkInvariants(), True)
+    results = self.bst.removeMany(list(range(-200, 1)) + [5000, 0])
+    self.assertEqual(results, [True] * 201 + [False, False])
+    self.assertEqual(self.bst.checkInvariants(), True)
+    self.assertEqual(self.bst.getKeys(), sorted(keys - set([0, 6, 9])))
+    self.assertEqual(self.bst.getMany([]), [])
+    self.assertEqual(AVLBST().getMany([1]), [None])
+
+  def test_snapshot(self):
+    bst = AVLBST(persistent=True)
+    keys = list(range(200))
+    shuffle(keys)
+    for k in keys:
+      bst.insert(k, "v1")
+    snap = bst.snapshot()
+    self.assertEqual(snap.isReadOnly(), True)
+    self.assertEqual(bst.isReadOnly(), False)
+    self.assertEqual(bst.sharedWith(snap)["shared"], 200)
+    for k in keys[:50]:
+      bst.remove(k)
+    for k in range(200, 250):
+      bst.insert(k, "v2")
+    bst.update(keys[60], "v3")
+    bst.popMin()
+    bst.deleteRange(keys[70], keys[70] + 2)
+    bst.insertMany([(k, "v4") for k in range(-20, 0)])
+    snap2 = bst.snapshot()
+    bst.removeMany(list(range(-20, -10)))
+    self.assertEqual(bst.checkInvariants(), True)
+    self.assertEqual(snap.checkInvariants(), True)
+    self.assertEqual(snap2.checkInvariants(), True)
+    self.assertEqual(snap.getItems(), [(k, "v1") for k in range(200)])
+    self.assertEqual(len(snap2), len(bst) + 10)
+    self.assertEqual(snap2.get(-15), "v4")
+    self.assertEqual(bst.contains(-15), False)
+    stats = bst.sharedWith(snap)
+    self.assertTrue(0 < stats["shared"] < 200)
+    self.assertRaises(TypeError, snap.insert, 1000, "x")
+    self.assertRaises(TypeError, snap.remove, keys[0])
+    self.assertRaises(TypeError, snap.update, keys[0], "x")
+    self.assertRaises(TypeError, snap.split, 5)
+    self.assertRaises(TypeError, snap.insertMany, [(1000, "x")])
+    self.assertEqual(snap.getItems(), [(k, "v1") for k in range(200)])
+    # plain trees can be snapshotted too
+    self.bst.insert("A", 1)
+    snap = self.bst.snapshot()
+    self.bst.update("A", 2)
+    self.assertEqual(snap.get("A"), 1)
+    self.assertEqual(self.bst.get("A"), 2)
+
+  def test_saveopen(self):
+    fn = os.path.join(tempfile.mkdtemp(), "tree.avl")
+    for keys in [self.keys, list(range(-50, 500, 7)), [0.5, 1.5, 2.5], []]:
+      items = [(k, [k, "v"]) for k in keys]
+      bst = AVLBST.fromSorted(items)
+      bst.save(fn)
+      with AVLBST.openMapped(fn) as mapped:
+        self.assertEqual(len(mapped), len(keys))
+        self.assertEqual(list(mapped.items()), items)
+        self.assertEqual(list(mapped.keys(reverse=True)), keys[::-1])
+        self.assertEqual(list(mapped), keys)
+        for k in keys:
+          self.assertEqual(mapped.get(k), [k, "v"])
+          self.assertEqual(k in mapped, True)
+        missing = 1000
+        if keys == self.keys:
+          missing = "ZZ"
+        self.assertEqual(mapped.contains(missing), False)
+        self.assertEqual(mapped.get(missing, "nope"), "nope")
+        if len(keys) > 5:
+          self.assertEqual(list(mapped.irange(keys[1], keys[4])), keys[1:5])
+          self.assertEqual(list(mapped.irange(keys[1], keys[4], (False,False),
+                                              True)), keys[3:1:-1])
+          self.assertEqual(mapped.countRange(keys[1], keys[4]), 4)
+          self.assertEqual(mapped.select(2), (keys[2], [keys[2], "v"]))
+      self.assertEqual(AVLBST.load(fn).getItems(), items)
+    with open(fn, "wb") as ofl:
+      ofl.write(b"not a tree" * 10)
+    self.assertRaises(ValueError, AVLBST.openMapped, fn)
+    for data in [b"AVLBST01", b""]:       # shorter than a header, empty
+      with open(fn, "wb") as ofl:
+        ofl.write(data)
+      self.assertRaises(ValueError, AVLBST.openMapped, fn)
+
+  @unittest.skipIf(numpy == None, "needs numpy")
+  def test_freeze(self):
+    for n in [0, 1, 2, 7, 8, 100]:
+      items = [(k, (k, "v")) for k in range(0, 3*n, 3)]
+      frozen = AVLBST.fromSorted(items).freeze()
+      self.assertEqual(len(frozen), n)
+      probe = list(range(-3, 3*n + 3))
+      expected = [(k, "v") if k % 3 == 0 and 0 <= k < 3*n else "x"
+                  for k in probe]
+      self.assertEqual(frozen.getMany(numpy.array(probe), "x"), expected)
+      self.assertEqual(frozen.getMany(probe, "x"), expected)
+      self.assertEqual(list(frozen.containsMany(probe)),
+                       [e != "x" for e in expected])
+      for k, e in zip(probe, expected):
+        self.assertEqual(frozen.get(k, "x"), e)
+    # level order of a perfect tree
+    frozen = AVLBST.fromSorted([(k, k) for k in range(7)]).freeze()
+    self.assertEqual(list(frozen._keys[1:]), [3, 1, 5, 0, 2, 4, 6])
+    frozen = AVLBST.fromSorted([(k/2, k) for k in range(7)]).freeze()
+    self.assertEqual(frozen.getMany([1.5, 1.25]), [3, None])
+    self.assertRaises(ValueError, AVLBST.fromSorted([("A", 1)]).freeze)
+
+  def test_copy(self):
+    for i in range(len(self.keys)):
+      self.bst.insert(self.keys[i], self.values[i])
+    bst = self.bst.copy()
+    bst.remove("A")
+    self.assertEqual(self.bst.getSize(), len(self.keys))
+    self.assertEqual(bst.getItems(), self.bst.getItems()[1:])
+
   def test_levelordertraversal(self):
     keys = self.keys[0:7]  # just A->G
     for i in range(len(keys)):
@@ -210,6 +746,390 @@ class TestAVLBSTMethods(unittest.TestCase):
       self.assertEqual(ilist[i][0], levelorder[i])
     self.assertEqual(self.bst.checkInvariants(), True)
     self.assertEqual(len(self.bst), len(keys))
+    self.assertEqual(list(self.bst.iterLevelOrder()), ilist)
+    levels = [[k for k,v in level] for level in self.bst.iterLevels()]
+    self.assertEqual(levels, [["D"], ["B", "F"], ["A", "C", "E", "G"]])
+    levels = [[k for k,v in level] for level in self.bst.iterLevels(1)]
+    self.assertEqual(levels, [["D"], ["B", "F"]])
+    self.assertEqual(list(AVLBST().iterLevels()), [])
+    self.assertEqual(list(AVLBST().iterLevelOrder()), [])
+
+  def test_dotfile(self):
+    for i in range(len(self.keys)):
+      self.bst.insert(self.keys[i], self.values[i])
+    lines = list(self.bst.dotLines())
+    self.assertEqual(lines[0], "digraph BST {\n")
+    self.assertEqual(lines[-1], "}\n")
+    edges = [line for line in lines if "->" in line and "null" not in line]
+    self.assertEqual(len(edges), len(self.keys) - 1)
+    nulls = [line for line in lines if "shape=point" in line]
+    self.assertEqual(len(nulls), len(self.keys) + 1)
+    self.assertEqual(len(list(self.bst.dotLines(nulls=False))), len(lines) - 2*len(nulls))
+    # root only, both subtrees as summary boxes
+    lines = list(self.bst.dotLines(maxDepth=0))
+    self.assertEqual(len([line for line in lines if "shape=box" in line]), 2)
+    self.assertIn('label="7 keys, height 2\\nA .. G"', "".join(lines))
+    # first 7 nodes = top 3 levels, 8 summary boxes below them
+    lines = list(self.bst.dotLines(maxNodes=10, nulls=False))
+    self.assertEqual(len([line for line in lines if "shape=box" in line]), 8)
+    output = io.StringIO()
+    self.bst.writeDot(output)
+    self.assertEqual(output.getvalue(), "".join(self.bst.dotLines()))
+    with tempfile.TemporaryDirectory() as tmpdir:
+      fn = os.path.join(tmpdir, "bst.dot")
+      self.assertEqual(self.bst.writeDotFile(fn, maxDepth=2), True)
+      with open(fn) as ifl:
+        self.assertEqual(ifl.read(), "".join(self.bst.dotLines(maxDepth=2)))
+      sys.stdout = io.StringIO()
+      self.assertEqual(self.bst.writeDotFile(os.path.join(tmpdir, "no", "x")),
+                       False)
+
+  def test_fromsorted(self):
+    items = list(zip(self.keys, self.values))
+    bst = AVLBST.fromSorted(items)
+    self.assertEqual(bst.checkInvariants(), True)
+    self.assertEqual(bst.getSize(), len(self.keys))
+    self.assertEqual(bst.getItems(), items)
+    self.assertEqual(bst.root.getHeight(), 4)
+    bst.insert("R", 1)
+    bst.remove("A")
+    self.assertEqual(bst.checkInvariants(), True)
+    self.assertEqual(AVLBST.fromSorted([]).isEmpty(), True)
+    self.assertRaises(ValueError, AVLBST.fromSorted, [("B",1),("A",2)])
+
+  def test_fromiterable(self):
+    items = list(zip(self.keys, self.values))
+    shuffle(items)
+    bst = AVLBST.fromIterable(items + [(items[0][0], "dup")])
+    self.assertEqual(bst.checkInvariants(), True)
+    self.assertEqual(bst.getSize(), len(self.keys))
+    self.assertEqual(bst.getItems(), sorted(items))
+    self.assertEqual(bst.get(items[0][0]), items[0][1])
+
+  def test_randomheights(self):
+    def height(node):
+      """recompute height, checking stored heights and balance on the way"""
+      if node == None:
+        return -1
+      lh = height(node.getLeft())
+      rh = height(node.getRight())
+      self.assertTrue(abs(lh - rh) <= 1)
+      self.assertEqual(node.getHeight(), max(lh, rh) + 1)
+      return node.getHeight()
+    keys = list(range(300))
+    shuffle(keys)
+    for k in keys:
+      self.bst.insert(k, k)
+    height(self.bst.root)
+    shuffle(keys)
+    for k in keys[:250]:
+      self.bst.remove(k)
+      height(self.bst.root)
+    self.assertEqual(self.bst.getKeys(), sorted(keys[250:]))
+    self.assertEqual(self.bst.checkInvariants(), True)
+
+  def test_checkinvariants(self):
+    for i in range(len(self.keys)):
+      self.bst.insert(self.keys[i], self.values[i])
+    self.assertEqual(self.bst.checkInvariants(), True)
+    self.assertEqual(self.bst.checkInvariants(samples=20), True)
+    output = io.StringIO()
+    sys.stdout = output
+    # bad height
+    self.bst.root.setHeight(7)
+    self.assertEqual(self.bst.checkInvariants(), False)
+    self.assertEqual(self.bst.checkInvariants(samples=1), False)
+    self.bst.root.setHeight(4)
+    # key out of order, deep in the tree
+    leaf = self.bst.findMax()
+    leaf.setKey("A")
+    self.assertEqual(self.bst.checkInvariants(), False)
+    leaf.setKey("Q")
+    # out of balance (heights consistent, but left side much taller)
+    bst = AVLBST()
+    bst.root = AVLBSTNode("C", 0, 2, AVLBSTNode("B", 0, 1, AVLBSTNode("A", 0, 0)))
+    bst.size = 3
+    self.assertEqual(bst.checkInvariants(), False)
+    # wrong size
+    self.bst.size += 1
+    self.assertEqual(self.bst.checkInvariants(), False)
+    msgs = ["AVL heights incorrect!!!", "AVL heights incorrect!!!",
+            "BST keys out of order!!!", "AVL tree out of balance!!!",
+            "BST size incorrect!!!"]
+    self.assertEqual(output.getvalue().split('\n')[:-1], msgs)
+
+  def test_instrument(self):
+    self.assertEqual(self.bst.isInstrumented(), False)
+    self.bst.instrument()
+    self.assertEqual(self.bst.isInstrumented(), True)
+    # A,B,C: one left rotation; then B,C,Bb: one right-left rotation
+    for k in "ABC":
+      self.bst.insert(k, 0)
+    self.bst.remove("A")
+    self.bst.insert("Bb", 0)
+    self.bst.remove("C")
+    stats = self.bst.stats()
+    self.assertEqual(stats["rotations"],
+                     {"left": 1, "right": 0, "rightLeft": 1, "leftRight": 0})
+    self.assertEqual(stats["searches"], 6)
+    self.assertEqual(self.bst.getKeys(), ["B", "Bb"])
+    self.bst.resetStats()
+    self.bst.get("Bb")          # root Bb: 2 comparisons
+    self.bst.contains("A")      # Bb, B, then off the left side
+    stats = self.bst.stats()
+    self.assertEqual(stats["searches"], 2)
+    self.assertEqual(stats["nodesVisited"], 3)
+    self.assertEqual(stats["comparisons"], 4)
+    self.assertEqual(stats["maxPathLength"], 2)
+    self.assertEqual(self.bst.checkInvariants(), True)
+    self.bst.instrument(False)
+    self.assertEqual(type(self.bst), AVLBST)
+    self.assertEqual(self.bst.isInstrumented(), False)
+    self.assertEqual(self.bst.getKeys(), ["B", "Bb"])
+
+class TestAVLBSTPoolMethods(unittest.TestCase):
+
+  def test_insertremove(self):
+    pool = AVLBSTPool()
+    bst = AVLBST()
+    keys = list(range(300))
+    shuffle(keys)
+    for k in keys:
+      self.assertEqual(pool.insert(k, str(k)), True)
+      bst.insert(k, str(k))
+    self.assertEqual(pool.insert(keys[0], "dup"), False)
+    self.assertEqual(pool.checkInvariants(), True)
+    self.assertEqual(pool.getItems(), bst.getItems())
+    self.assertEqual(pool.root, keys.index(bst.root.getKey()))
+    shuffle(keys)
+    for k in keys[:200]:
+      self.assertEqual(pool.remove(k), True)
+      self.assertEqual(pool.checkInvariants(), True)
+    self.assertEqual(pool.remove(keys[0]), False)
+    self.assertEqual(pool.getKeys(), sorted(keys[200:]))
+    for k in keys[:100]:
+      pool.insert(k, k)      # reuses freed slots
+    self.assertEqual(len(pool.keys), 300)
+    self.assertEqual(pool.checkInvariants(), True)
+    self.assertEqual(pool.get(keys[0]), keys[0])
+    self.assertEqual(pool.update(keys[0], "x"), True)
+    self.assertEqual(pool.get(keys[0]), "x")
+    self.assertEqual(pool.update(keys[150], "x"), False)
+    self.assertEqual(pool.get(keys[150]), None)
+    self.assertEqual(pool.get(keys[150], "no"), "no")
+    self.assertEqual(pool.contains(keys[150]), False)
+    self.assertEqual(len(pool), 200)
+
+class TestAVLBSTProfilerMethods(unittest.TestCase):
+
+  def test_histogram(self):
+    hist = LatencyHistogram()
+    self.assertEqual(hist.percentile(50), 0.0)
+    for i in range(1, 1001):
+      hist.record(i * 1e-6)
+    self.assertEqual(hist.count, 1000)
+    self.assertEqual(hist.max, 1e-3)
+    # bucket bounds are at most 2**(1/4) too big
+    for p, exact in [(50, 500e-6), (99, 990e-6), (99.9, 999e-6)]:
+      self.assertTrue(exact <= hist.percentile(p) <= exact * 2**0.25)
+    self.assertEqual(sum(count for bound, count in hist.buckets()), 1000)
+
+  def test_profiler(self):
+    bst = AVLBST()
+    profiler = AVLBSTProfiler(bst, sampleEvery=100)
+    calls = []
+    profiler.addHook(lambda op, seconds: calls.append(op))
+    with profiler:
+      for i in range(300):
+        bst.insert(i, i)
+      for i in range(300):
+        bst.get(i)
+      self.assertEqual(sum(1 for key in bst.keys()), 300)
+      self.assertEqual(len(bst.traverseLevelOrder()), 300)
+      with profiler.measure("custom"):
+        bst.remove(0)
+    self.assertEqual(profiler.histograms["insert"].count, 300)
+    self.assertEqual(profiler.histograms["get"].count, 300)
+    self.assertEqual(profiler.histograms["keys"].count, 1)
+    self.assertEqual(profiler.histograms["custom"].count, 1)
+    self.assertEqual(len(calls), 604)
+    # sampled when attached, every 100 ops, and when detached
+    self.assertEqual(len(profiler.samples), 8)
+    self.assertEqual(profiler.samples[-1][1:], (299, 9))
+    # detached: plain methods again
+    self.assertEqual("insert" in bst.__dict__, False)
+    bst.insert(1000, 0)
+    self.assertEqual(profiler.histograms["insert"].count, 300)
+    with tempfile.TemporaryDirectory() as tmpdir:
+      jsonfile = os.path.join(tmpdir, "avlbst.json")
+      profiler.writeJSON(jsonfile)
+      with open(jsonfile) as ifl:
+        report = json.load(ifl)
+      self.assertEqual(report["operations"]["get"]["count"], 300)
+      promfile = os.path.join(tmpdir, "avlbst.prom")
+      profiler.writePrometheus(promfile)
+      with open(promfile) as ifl:
+        lines = ifl.read().split("\n")
+      self.assertIn('avlbst_op_latency_seconds_count{op="insert"} 300', lines)
+      self.assertIn('avlbst_op_latency_seconds_bucket{op="get",le="+Inf"} 300',
+                    lines)
+      self.assertIn("avlbst_size 299", lines)
+
+  def test_profilernested(self):
+    bst = AVLBST()
+    profiler = AVLBSTProfiler(bst)
+    with profiler:
+      bst.insertMany([(i, i) for i in range(100)])
+      bst.getItems()
+      bst.copy()
+      self.assertEqual(bst == bst.copy(), True)
+      self.assertEqual(bst.getKeys(), list(range(100)))
+      for key in bst.keys():
+        bst.get(key)        # between items: not inside keys()
+    counts = dict((op, h.count) for op, h in profiler.histograms.items())
+    self.assertEqual(counts, {"insertMany": 1, "getItems": 1, "getKeys": 1,
+                              "keys": 1, "get": 100})
+    profiler.reset()
+    with profiler:
+      self.assertEqual(len(bst.traverseLevelOrder()), 100)
+      self.assertEqual(len(list(bst.iterLevelOrder())), 100)
+      self.assertEqual(len(list(bst.iterLevels(2))), 3)
+    counts = dict((op, h.count) for op, h in profiler.histograms.items())
+    self.assertEqual(counts, {"traverseLevelOrder": 1, "iterLevelOrder": 1,
+                              "iterLevels": 1})
+
+class TestConcurrentAVLBSTMethods(unittest.TestCase):
+
+  def test_readerstogether(self):
+    lock = RWLock()
+    both = threading.Barrier(2, timeout=5)
+    def reader():
+      with lock.readLocked():
+        both.wait()        # only returns if both readers hold the lock
+    threads = [threading.Thread(target=reader) for i in range(2)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertEqual(both.broken, False)
+    self.assertEqual(lock.stats()["read"]["acquired"], 2)
+
+  def test_threads(self):
+    ctree = ConcurrentAVLBST(batchSize=50)
+    def writer(start):
+      for i in range(start, start + 500):
+        ctree.queueInsert(i, i)
+    def remover():
+      for i in range(0, 2000, 7):
+        ctree.remove(i)
+    def reader():
+      for i in range(500):
+        ctree.get(randrange(2000))
+    threads = [threading.Thread(target=writer, args=(i*500,)) for i in range(4)]
+    threads += [threading.Thread(target=reader) for i in range(2)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    remover()
+    self.assertEqual(ctree.tree.checkInvariants(), True)
+    self.assertEqual(len(ctree), 2000 - len(range(0, 2000, 7)))
+    stats = ctree.stats()
+    self.assertEqual(stats["batchedInserts"], 2000)
+    self.assertEqual(stats["pending"], 0)
+    ctree.queueInsert(5000, "x")
+    self.assertEqual(ctree.get(5000), "x")     # reads flush the queue
+    snap = ctree.snapshot()
+    ctree.remove(5000)
+    self.assertEqual(snap.get(5000), "x")
+
+  def test_flushorder(self):
+    ctree = ConcurrentAVLBST()
+    ctree.queueInsert(1, "a")
+    flusher = threading.Thread(target=ctree.flush)
+    with ctree.lock.writeLocked():
+      flusher.start()
+      while ctree.lock._waitingWriters == 0:
+        time.sleep(0.001)
+      # flush() is waiting for the lock: the insert must still be queued
+      self.assertEqual(ctree._pending, [(1, "a")])
+    flusher.join()
+    self.assertEqual(ctree._pending, [])
+    self.assertEqual(ctree.get(1), "a")
+
+class TestShardedAVLBSTMethods(unittest.TestCase):
+
+  def test_sharded(self):
+    keys = list(range(0, 1000, 2))
+    shuffle(keys)
+    with ShardedAVLBST(maxShardSize=100, chunkSize=30) as tree:
+      self.assertEqual(tree.insertMany([(k, str(k)) for k in keys[:400]]),
+                       [True] * 400)
+      for k in keys[400:]:
+        self.assertEqual(tree.insert(k, str(k)), True)
+      self.assertEqual(tree.insert(10, "x"), False)
+      self.assertEqual(len(tree), 500)
+      sizes = tree.shardSizes()
+      self.assertEqual(sum(sizes), 500)
+      self.assertEqual(len(sizes) > 4, True)         # shards were split
+      self.assertEqual(max(sizes) <= 100, True)
+      self.assertEqual(len(tree.bounds), len(sizes) - 1)
+      self.assertEqual(list(tree), list(range(0, 1000, 2)))
+      self.assertEqual(list(tree.keys(reverse=True)), list(range(998, -1, -2)))
+      self.assertEqual(list(tree.irange(101, 421)), list(range(102, 421, 2)))
+      self.assertEqual(list(tree.irange(100, 420, (False, False), True)),
+                       list(range(418, 100, -2)))
+      self.assertEqual(tree.countRange(100, 420), 161)
+      self.assertEqual(tree.get(444), "444")
+      self.assertEqual(tree.get(445, "no"), "no")
+      self.assertEqual(445 in tree, False)
+      self.assertEqual(tree.getMany([998, 1, 0]), ["998", None, "0"])
+      self.assertEqual(tree.updateMany([(0, "a"), (1, "b")]), [True, False])
+      self.assertEqual(tree.upsert(1, "b"), True)
+      self.assertEqual(list(tree.items())[:2], [(0, "a"), (1, "b")])
+      self.assertEqual(tree.remove(1), True)
+      self.assertEqual(tree.removeMany(range(0, 500, 2)), [True] * 250)
+      self.assertEqual(tree.removeMany([0]), [False])
+      self.assertEqual(list(tree.values())[:2], ["500", "502"])
+      self.assertEqual(tree.sizes, tree.shardSizes())
+      self.assertEqual(len(tree), 250)
+    self.assertEqual(tree._procs, [])
+    with ShardedAVLBST.fromIterable([(k, k) for k in keys], shards=4) as tree:
+      self.assertEqual(tree.shardSizes(), [125] * 4)
+      self.assertEqual(tree.bounds, [250, 500, 750])
+      self.assertEqual(list(tree.irange(240, 260)), list(range(240, 261, 2)))
+
+  def test_shardederrors(self):
+    with ShardedAVLBST(bounds=[10]) as tree:
+      tree.insertMany([(k, k) for k in range(20)])
+      # shard 0 fails, shard 1 answers: both replies must be read
+      self.assertRaises(IndexError, tree.updateMany, [(1,), (15, "a")])
+      self.assertEqual(tree.get(15), "a")
+      self.assertEqual(tree.get(16), 16)
+      self.assertRaises(IndexError, tree.updateMany, [(1, "b"), (15,)])
+      self.assertEqual(tree.get(1), "b")
+      self.assertEqual(tree.get(2), 2)
+      self.assertEqual(tree.getMany([1, 15, 99]), ["b", "a", None])
+      self.assertEqual(tree.countRange(5, 14), 10)
+      self.assertEqual(tree.shardSizes(), [10, 10])
+
+  def test_shardedsplits(self):
+    keys = list(range(1000))
+    shuffle(keys)
+    with ShardedAVLBST(maxShardSize=100) as tree:
+      tree.insertMany([(k, k) for k in keys])      # one big batch
+      sizes = tree.shardSizes()
+      self.assertEqual(sum(sizes), 1000)
+      self.assertEqual(max(sizes) <= 100, True)
+      self.assertEqual(len(sizes), 10)
+      self.assertEqual(tree.sizes, sizes)
+      self.assertEqual(list(tree), list(range(1000)))
+    items = [(k, k) for k in range(1000)]
+    with ShardedAVLBST.fromSorted(items, shards=2, maxShardSize=150) as tree:
+      sizes = tree.shardSizes()
+      self.assertEqual(sum(sizes), 1000)
+      self.assertEqual(max(sizes) <= 150, True)
+      self.assertEqual(list(tree.items()), items)
 
 ####################################################
 